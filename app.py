@@ -1,9 +1,25 @@
+import csv
+import io
 import logging
-from flask import Flask, request, jsonify, render_template  # type: ignore
+from flask import Flask, Response, g, request, jsonify, render_template  # type: ignore
 import os
+import queue
 import requests
 import sqlite3
 import re
+import hashlib
+import itertools
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextvars import ContextVar, copy_context
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 app = Flask(__name__)
 
@@ -15,175 +31,2752 @@ logger = logging.getLogger(__name__)
 SONARR_API_URL = os.getenv("SONARR_API_URL", "http://localhost:8989/api/v3")
 SONARR_API_KEY = os.getenv("SONARR_API_KEY")
 
-# Headers for Sonarr API
-headers = {"X-Api-Key": SONARR_API_KEY}
+# Further Sonarr instances, each with its own connection pool, cache and limits. The one above is
+# always available as DEFAULT_INSTANCE. The optional JSON file holds a list of
+# {"name", "url", "api_key", "max_connections", "workers", "cache_ttl", "cache_size"} and is
+# copied into the sonarr_instances table at startup; instances can also be added through the API.
+DEFAULT_INSTANCE = "default"
+SONARR_INSTANCES_FILE = os.getenv("SONARR_INSTANCES_FILE", "/config/sonarr-instances.json")
 
-DB_PATH = "/config/renamerr.db"
+# Sonarr connection settings
+SONARR_MAX_CONNECTIONS = int(os.getenv("SONARR_MAX_CONNECTIONS", 4))
+SONARR_CONNECT_TIMEOUT = float(os.getenv("SONARR_CONNECT_TIMEOUT", 5))
+SONARR_READ_TIMEOUT = float(os.getenv("SONARR_READ_TIMEOUT", 30))
+SONARR_RETRIES = int(os.getenv("SONARR_RETRIES", 3))
+SONARR_RETRY_BACKOFF = float(os.getenv("SONARR_RETRY_BACKOFF", 0.5))
 
-# Format template for generating new filenames
-# format_template = (
-#     "{Series_Title} - {episode:02d} [{Quality_Full} {MediaInfo_VideoCodec}]"
-#     "[{Mediainfo_AudioCodec} {Mediainfo_AudioChannels}]{Release_Group}"
-# )
-## New Template format
-format_template = (
-    "{Series_Title} - {episode:02d} [{Quality_Full} {MediaInfo_VideoCodec} {Mediainfo_AudioCodec}]{Release_Group}"
+# Cache settings for Sonarr payloads
+SONARR_CACHE_TTL = float(os.getenv("SONARR_CACHE_TTL", 300))
+SONARR_CACHE_SIZE = int(os.getenv("SONARR_CACHE_SIZE", 4096))
+
+# Sonarr webhook events after which the cached payloads of a series are stale
+SERIES_INVALIDATING_EVENTS = {"Download", "Rename", "SeriesAdd", "SeriesDelete", "EpisodeFileDelete"}
+
+# Content type of the streaming endpoints, one JSON record per line
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Rename journal settings: how many completed moves are marked per transaction, what to do
+# with batches interrupted by a crash ("rollback" or "resume") and how long finished batches are kept
+JOURNAL_FLUSH_SIZE = int(os.getenv("JOURNAL_FLUSH_SIZE", 50))
+JOURNAL_RECOVERY = os.getenv("JOURNAL_RECOVERY", "rollback")
+JOURNAL_RETENTION_DAYS = int(os.getenv("JOURNAL_RETENTION_DAYS", 30))
+
+# Concurrency settings for library-wide sweeps
+AUTORENAME_WORKERS = int(os.getenv("AUTORENAME_WORKERS", 4))
+
+# Sonarr rescans: seconds a rescan waits for more renames of the same series (0 sends it
+# right away) and minimum seconds between two RescanSeries commands
+RESCAN_DEBOUNCE = float(os.getenv("RESCAN_DEBOUNCE", 5))
+RESCAN_INTERVAL = float(os.getenv("RESCAN_INTERVAL", 1))
+
+# Background jobs: how many run at once, how often their progress is written, how often
+# idle workers look for jobs queued by another process, and how long finished jobs are kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", 1))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 5))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", 30))
+
+DB_PATH = os.getenv("DB_PATH", "/config/renamerr.db")
+
+# Default rename template, used by series without a template of their own.
+# Renders exactly like the former fixed format, so existing libraries stay "already renamed".
+DEFAULT_RENAME_TEMPLATE = os.getenv(
+    "RENAME_TEMPLATE",
+    "{Series Title} - {episode:00} [{Quality Full} {MediaInfo VideoCodec} {MediaInfo AudioCodec}]{-Release Group}"
 )
 
-def initialize_database():
-    """Initialize the SQLite database."""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# How renames are carried out for series without a backend of their own: "local" moves the
+# files itself and has Sonarr rescan the series, "sonarr" runs Sonarr's RenameFiles command
+RENAME_BACKENDS = ("local", "sonarr")
+RENAME_BACKEND = os.getenv("RENAME_BACKEND", "local")
+
+# Sonarr commands (RenameFiles) are polled every SONARR_COMMAND_POLL_INTERVAL seconds until they finish
+SONARR_COMMAND_TIMEOUT = float(os.getenv("SONARR_COMMAND_TIMEOUT", 300))
+SONARR_COMMAND_POLL_INTERVAL = float(os.getenv("SONARR_COMMAND_POLL_INTERVAL", 1))
+
+# Most timings kept in the trace returned by ?profile=1, the rest is only counted
+PROFILE_MAX_SPANS = 2000
+
+class Metrics:
+    """
+    In-process registry of counters, gauges and histograms, rendered in the Prometheus text
+    format by /metrics. Values are per process: with several gunicorn workers each one has its own.
+    """
+
+    def __init__(self):
+        self._definitions = {}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labels=()):
+        self._definitions[name] = ("counter", help_text, labels, None)
+
+    def gauge(self, name, help_text, labels=()):
+        self._definitions[name] = ("gauge", help_text, labels, None)
+
+    def histogram(self, name, help_text, labels=(), buckets=()):
+        self._definitions[name] = ("histogram", help_text, labels, tuple(buckets))
+
+    def inc(self, name, *labels, value=1):
+        with self._lock:
+            self._values[(name, labels)] = self._values.get((name, labels), 0) + value
+
+    def set(self, name, value, *labels):
+        with self._lock:
+            self._values[(name, labels)] = value
+
+    def observe(self, name, value, *labels):
+        buckets = self._definitions[name][3]
+        with self._lock:
+            series = self._values.get((name, labels))
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                series = self._values[(name, labels)] = [[0] * (len(buckets) + 1), 0.0, 0]
+            series[0][bisect_left(buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    @staticmethod
+    def _labels(names, values):
+        pairs = []
+        for name, value in zip(names, values):
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{name}="{value}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        with self._lock:
+            values = {key: (value if not isinstance(value, list) else [list(value[0]), value[1], value[2]])
+                      for key, value in self._values.items()}
+        lines = []
+        for name, (kind, help_text, label_names, buckets) in self._definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (series_name, labels), value in sorted(values.items(), key=lambda item: item[0][1]):
+                if series_name != name:
+                    continue
+                if kind != "histogram":
+                    lines.append(f"{name}{self._labels(label_names, labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), value[0]):
+                    cumulative += count
+                    bucket_labels = self._labels(label_names + ("le",), labels + (bound,))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(label_names, labels)} {round(value[1], 6)}")
+                lines.append(f"{name}_count{self._labels(label_names, labels)} {value[2]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.counter("renamerr_files_total", "Episode files handled by renames, by result.", ("result",))
+metrics.histogram(
+    "renamerr_sonarr_request_duration_seconds", "Latency of requests sent to Sonarr.", ("instance", "method", "endpoint"),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+metrics.counter(
+    "renamerr_sonarr_request_errors_total", "Requests to Sonarr that failed or answered an error.", ("instance", "method", "endpoint")
+)
+RENAME_PHASE_METRIC = "renamerr_rename_phase_duration_seconds"
+metrics.histogram(
+    RENAME_PHASE_METRIC, "Time spent per phase of a series rename.", ("phase",),
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+)
+metrics.histogram(
+    "renamerr_db_query_duration_seconds", "Duration of SQLite statements, by statement type.", ("operation",),
+    (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+)
+metrics.counter("renamerr_rescans_total", "Rescans requested from the scheduler, by outcome.", ("result",))
+metrics.counter("renamerr_cache_requests_total", "Sonarr cache lookups, by result.", ("instance", "result"))
+metrics.counter("renamerr_cache_removals_total", "Entries dropped from the Sonarr cache, by reason.", ("instance", "reason"))
+metrics.gauge("renamerr_cache_entries", "Payloads currently held in the Sonarr cache.", ("instance",))
 
-    # Create the table if it doesn't exist
-    cursor.execute("""
+# Timings of the current request, when it was sent with ?profile=1
+_profile = ContextVar("profile", default=None)
+
+def observe_timing(metric, seconds, *labels):
+    """Record a duration in a histogram, and in the current request's profile when one is taken."""
+    metrics.observe(metric, seconds, *labels)
+    profile = _profile.get()
+    if profile is not None:
+        if len(profile["spans"]) < PROFILE_MAX_SPANS:
+            profile["spans"].append({
+                "name": metric.replace("renamerr_", "").replace("_duration_seconds", ""),
+                "labels": list(labels),
+                "start_ms": round((time.perf_counter() - seconds - profile["started"]) * 1000, 3),
+                "ms": round(seconds * 1000, 3),
+            })
+        else:
+            profile["dropped"] += 1
+
+@contextmanager
+def timed(metric, *labels):
+    """Time the enclosed block with observe_timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_timing(metric, time.perf_counter() - started, *labels)
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Append new steps to the end, never edit or reorder the ones already released.
+SCHEMA_MIGRATIONS = [
+    # 1: chosen titles and folder preferences
+    [
+        """
         CREATE TABLE IF NOT EXISTS series_titles (
             series_id INTEGER PRIMARY KEY,
             chosen_title TEXT NOT NULL,
             use_season_folders BOOLEAN NOT NULL DEFAULT 1,
             use_absolute_numbering BOOLEAN NOT NULL DEFAULT 0
-        );
-    """)
-    conn.commit()
-    conn.close()
-
-def get_stored_series_info(series_id):
-    """Retrieve the stored info for a series."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT chosen_title, use_season_folders, use_absolute_numbering FROM series_titles WHERE series_id = ?", 
-        (series_id,)
-    )
-    result = cursor.fetchone()
-    conn.close()
+        )
+        """,
+    ],
+    # 2: per-series watermark of the episode files seen by the last autorename
+    [
+        """
+        CREATE TABLE IF NOT EXISTS series_watermarks (
+            series_id INTEGER PRIMARY KEY,
+            settings_hash TEXT NOT NULL,
+            files_hash TEXT NOT NULL,
+            file_stamps TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ],
+    # 3: per-series rename template, NULL uses DEFAULT_RENAME_TEMPLATE
+    [
+        "ALTER TABLE series_titles ADD COLUMN rename_template TEXT",
+    ],
+    # 4: write-ahead journal of rename batches
+    [
+        """
+        CREATE TABLE IF NOT EXISTS rename_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            series_id INTEGER,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rename_journal (
+            batch_id INTEGER NOT NULL REFERENCES rename_batches(id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            old_path TEXT NOT NULL,
+            new_path TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'planned',
+            PRIMARY KEY (batch_id, seq)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS rename_batches_status ON rename_batches (status)",
+    ],
+    # 5: background jobs and their progress
+    [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            files_done INTEGER NOT NULL DEFAULT 0,
+            files_total INTEGER NOT NULL DEFAULT 0,
+            series_done INTEGER NOT NULL DEFAULT 0,
+            series_total INTEGER NOT NULL DEFAULT 0,
+            current_series TEXT,
+            eta_seconds REAL,
+            result TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)",
+    ],
+    # 6: per-series rename backend, NULL uses RENAME_BACKEND
+    [
+        "ALTER TABLE series_titles ADD COLUMN rename_backend TEXT",
+    ],
+    # 7: several Sonarr instances, series are keyed by (instance, series_id)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS sonarr_instances (
+            name TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            api_key TEXT,
+            max_connections INTEGER,
+            workers INTEGER,
+            cache_ttl REAL,
+            cache_size INTEGER
+        )
+        """,
+        """
+        CREATE TABLE series_titles_new (
+            instance TEXT NOT NULL DEFAULT 'default',
+            series_id INTEGER NOT NULL,
+            chosen_title TEXT NOT NULL,
+            use_season_folders BOOLEAN NOT NULL DEFAULT 1,
+            use_absolute_numbering BOOLEAN NOT NULL DEFAULT 0,
+            rename_template TEXT,
+            rename_backend TEXT,
+            PRIMARY KEY (instance, series_id)
+        )
+        """,
+        """
+        INSERT INTO series_titles_new
+            (series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend)
+        SELECT series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend
+        FROM series_titles
+        """,
+        "DROP TABLE series_titles",
+        "ALTER TABLE series_titles_new RENAME TO series_titles",
+        """
+        CREATE TABLE series_watermarks_new (
+            instance TEXT NOT NULL DEFAULT 'default',
+            series_id INTEGER NOT NULL,
+            settings_hash TEXT NOT NULL,
+            files_hash TEXT NOT NULL,
+            file_stamps TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (instance, series_id)
+        )
+        """,
+        """
+        INSERT INTO series_watermarks_new (series_id, settings_hash, files_hash, file_stamps, updated_at)
+        SELECT series_id, settings_hash, files_hash, file_stamps, updated_at FROM series_watermarks
+        """,
+        "DROP TABLE series_watermarks",
+        "ALTER TABLE series_watermarks_new RENAME TO series_watermarks",
+        "ALTER TABLE rename_batches ADD COLUMN instance TEXT NOT NULL DEFAULT 'default'",
+    ],
+    # 8: Sonarr naming settings replaced by the "sonarr" rename backend, one claim per instance
+    [
+        """
+        CREATE TABLE IF NOT EXISTS sonarr_naming_claims (
+            instance TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            naming TEXT,
+            claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ],
+]
+
+class TimedConnection(sqlite3.Connection):
+    """SQLite connection recording the duration of every statement, by statement type."""
+
+    def execute(self, sql, parameters=()):
+        with timed("renamerr_db_query_duration_seconds", sql.split(None, 1)[0].upper()):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        with timed("renamerr_db_query_duration_seconds", sql.split(None, 1)[0].upper()):
+            return super().executemany(sql, parameters)
+
+# One connection per thread, opened lazily and kept for the lifetime of the thread
+_db_local = threading.local()
+
+def get_db():
+    """Return the calling thread's SQLite connection, opening it on first use."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None or _db_local.path != DB_PATH:
+        # Autocommit mode, writes are grouped explicitly with db_transaction()
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, factory=TimedConnection)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        _db_local.conn = conn
+        _db_local.path = DB_PATH
+    return conn
+
+def close_db():
+    """Close the calling thread's SQLite connection, e.g. before a server forks its workers."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _db_local.conn = None
+
+@contextmanager
+def db_transaction():
+    """Run the enclosed statements in one write transaction, committed with a single fsync."""
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def initialize_database():
+    """Initialize the SQLite database and bring its schema up to date."""
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    conn = get_db()
+    # WAL lets readers proceed while a rename batch is being written; the setting persists in the file
+    conn.execute("PRAGMA journal_mode = WAL")
+
+    # BEGIN IMMEDIATE serializes concurrent starts, so each migration runs exactly once
+    with db_transaction():
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, steps in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            logger.info(f"Applied database migration {number}")
+        conn.execute(f"PRAGMA user_version = {len(SCHEMA_MIGRATIONS)}")
+
+def get_stored_series_info(series_id, instance=None):
+    """Retrieve the stored info for a series of an instance, the current one by default."""
+    result = get_db().execute(
+        "SELECT chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend FROM series_titles WHERE instance = ? AND series_id = ?",
+        (instance or current_instance().name, series_id)
+    ).fetchone()
     
     if result:
         return {
             "chosen_title": result[0],
             "use_season_folders": bool(result[1]),
-            "use_absolute_numbering": bool(result[2])
+            "use_absolute_numbering": bool(result[2]),
+            "rename_template": result[3],
+            "rename_backend": result[4]
         }
     return None
 
 def get_all_stored_series():
-    """Retrieve all series information from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT series_id, chosen_title, use_season_folders, use_absolute_numbering FROM series_titles")
-    results = cursor.fetchall()
-    conn.close()
+    """Retrieve all series information from the database, keyed by series_key."""
+    results = get_db().execute(
+        "SELECT instance, series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend FROM series_titles"
+    ).fetchall()
     return {
-        str(series_id): {
+        series_key(instance, series_id): {
+            "instance": instance,
             "chosen_title": title,
             "use_season_folders": bool(use_season_folders),
-            "use_absolute_numbering": bool(use_absolute_numbering)
+            "use_absolute_numbering": bool(use_absolute_numbering),
+            "rename_template": rename_template,
+            "rename_backend": rename_backend
         }
-        for series_id, title, use_season_folders, use_absolute_numbering in results
+        for instance, series_id, title, use_season_folders, use_absolute_numbering, rename_template, rename_backend in results
     }
 
-def store_series_info(series_id, chosen_title, use_season_folders, use_absolute_numbering):
-    """Store or update the series information."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT OR REPLACE INTO series_titles 
-        (series_id, chosen_title, use_season_folders, use_absolute_numbering)
-        VALUES (?, ?, ?, ?)
-    """, (series_id, chosen_title, use_season_folders, use_absolute_numbering))
-    conn.commit()
-    conn.close()
-
-def generate_new_filename(episode_file, chosen_title, episode_label, file_extension):
-    """Generate a new filename based on the episode file details."""
-    quality = episode_file["quality"]["quality"]["name"]
-    media_info = episode_file.get("mediaInfo", {})
-    video_codec = media_info.get("videoCodec", "")
-    audio_codec = media_info.get("audioCodec", "")
-    audio_channels = str(media_info.get("audioChannels", ""))
-    if audio_channels == "2":
-        audio_channels = "2.0"
-    release_group = episode_file.get("releaseGroup", "")
-    release_group_part = f"-{release_group}" if release_group else ""
-
-    # Use the format_template to generate the new filename
-    new_filename = format_template.format(
-        Series_Title=chosen_title,
-        episode=episode_label,
-        Quality_Full=quality,
-        MediaInfo_VideoCodec=video_codec,
-        Mediainfo_AudioCodec=audio_codec,
-        Mediainfo_AudioChannels=audio_channels,
-        Release_Group=release_group_part,
-    ) + file_extension  # Add the original extension
-
-    return new_filename
+SERIES_INFO_UPSERT = """
+    INSERT INTO series_titles (instance, series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(instance, series_id) DO UPDATE SET
+        chosen_title = excluded.chosen_title,
+        use_season_folders = excluded.use_season_folders,
+        use_absolute_numbering = excluded.use_absolute_numbering,
+        rename_template = excluded.rename_template,
+        rename_backend = excluded.rename_backend
+"""
+
+def store_series_info(series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template=None,
+                      rename_backend=None, instance=None):
+    """Store or update the series information, for the current instance by default."""
+    with db_transaction() as conn:
+        conn.execute(
+            SERIES_INFO_UPSERT,
+            (instance or current_instance().name, series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend)
+        )
+
+def store_series_info_bulk(series_infos):
+    """
+    Store or update the information of many series in a single transaction.
+
+    Args:
+        series_infos (list): Tuples of (instance, series_id, chosen_title, use_season_folders,
+            use_absolute_numbering, rename_template, rename_backend).
+    """
+    with db_transaction() as conn:
+        conn.executemany(SERIES_INFO_UPSERT, series_infos)
+    return len(series_infos)
+
+def get_series_watermark(series_id, instance=None):
+    """Retrieve the watermark stored by the last autorename of a series, of the current instance by default."""
+    result = get_db().execute(
+        "SELECT settings_hash, files_hash, file_stamps FROM series_watermarks WHERE instance = ? AND series_id = ?",
+        (instance or current_instance().name, series_id)
+    ).fetchone()
+
+    if result:
+        return {
+            "settings_hash": result[0],
+            "files_hash": result[1],
+            "file_stamps": json.loads(result[2])
+        }
+    return None
+
+def store_series_watermark(series_id, settings_hash, files_hash, file_stamps, instance=None):
+    """Store or update the watermark of a series, of the current instance by default."""
+    with db_transaction() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO series_watermarks
+            (instance, series_id, settings_hash, files_hash, file_stamps, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (instance or current_instance().name, series_id, settings_hash, files_hash, json.dumps(file_stamps)))
+
+class SonarrClient:
+    """
+    Pooled, keep-alive client for the Sonarr API.
+
+    All requests share one Session whose connection pool is capped at max_connections;
+    callers block until a connection is free. Idempotent requests are retried with
+    exponential backoff on 5xx responses and connection errors, and every request is
+    bounded by the connect/read timeouts. Request counts and latency are tracked per endpoint.
+    """
+
+    def __init__(self, base_url, api_key, max_connections=4, connect_timeout=5.0, read_timeout=30.0,
+                 retries=3, backoff_factor=0.5, name=DEFAULT_INSTANCE):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({"X-Api-Key": api_key or ""})
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def endpoint_name(path):
+        """Normalize a request path so that /series/12 and /series/34 share one stats entry."""
+        return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+    def request(self, method, path, **kwargs):
+        """Send a request to Sonarr and record its latency."""
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = self.endpoint_name(path)
+        start = time.perf_counter()
+        failed = False
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            failed = response.status_code >= 400
+            return response
+        except requests.RequestException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record(f"{method} {endpoint}", elapsed, failed)
+            observe_timing("renamerr_sonarr_request_duration_seconds", elapsed, self.name, method, endpoint)
+            if failed:
+                metrics.inc("renamerr_sonarr_request_errors_total", self.name, method, endpoint)
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params=params)
+
+    def post(self, path, payload):
+        return self.request("POST", path, json=payload)
+
+    def put(self, path, payload):
+        return self.request("PUT", path, json=payload)
+
+    def close(self):
+        """Close the pooled connections, e.g. before a server forks its workers. The client stays usable."""
+        self.session.close()
+
+    def _record(self, endpoint, elapsed, failed):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["count"] += 1
+            stats["errors"] += int(failed)
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+    def stats(self):
+        """Return a snapshot of request counts and latency per endpoint."""
+        with self._stats_lock:
+            return {
+                endpoint: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "avg_ms": round(stats["total_seconds"] / stats["count"] * 1000, 2),
+                    "max_ms": round(stats["max_seconds"] * 1000, 2),
+                }
+                for endpoint, stats in self._stats.items()
+            }
+
+class SonarrError(Exception):
+    """Raised when Sonarr answers a request with an unexpected status code."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize=4096, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate):
+        """Drop every entry whose key matches predicate, returning how many were dropped."""
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+class SonarrInstance:
+    """
+    One Sonarr server: a client with its own connection pool, which also bounds its concurrent
+    requests, a payload cache and a series search index. Autorename processes at most
+    `workers` of its series at once.
+    """
+
+    def __init__(self, name, url, api_key, max_connections=None, workers=None, cache_ttl=None, cache_size=None):
+        self.name = name
+        self.url = url
+        self.settings = (name, url, api_key, max_connections, workers, cache_ttl, cache_size)
+        self.max_connections = max_connections or SONARR_MAX_CONNECTIONS
+        self.workers = workers or AUTORENAME_WORKERS
+        self.client = SonarrClient(
+            url,
+            api_key,
+            max_connections=self.max_connections,
+            connect_timeout=SONARR_CONNECT_TIMEOUT,
+            read_timeout=SONARR_READ_TIMEOUT,
+            retries=SONARR_RETRIES,
+            backoff_factor=SONARR_RETRY_BACKOFF,
+            name=name,
+        )
+        self.cache = TTLCache(maxsize=cache_size or SONARR_CACHE_SIZE, ttl=cache_ttl or SONARR_CACHE_TTL)
+        # Sonarr's naming settings are global to the server, renames of its series take turns changing them
+        self.naming_lock = threading.Lock()
+        self.series_index = None
+        self.series_index_lock = threading.Lock()
+
+    def describe(self):
+        """Settings of the instance, without its API key."""
+        return {
+            "name": self.name,
+            "url": self.url,
+            "max_connections": self.max_connections,
+            "workers": self.workers,
+            "cache_ttl": self.cache.ttl,
+            "cache_size": self.cache.maxsize,
+        }
+
+INSTANCE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+INSTANCE_COLUMNS = ("name", "url", "api_key", "max_connections", "workers", "cache_ttl", "cache_size")
+
+def parse_instance_config(config):
+    """
+    Validate the settings of a Sonarr instance, as given in SONARR_INSTANCES_FILE or to the API.
+
+    Returns:
+        tuple: The sonarr_instances row, in INSTANCE_COLUMNS order.
+
+    Raises:
+        ValueError: When the name or the URL is missing or invalid.
+    """
+    name = config.get("name")
+    if not name or not INSTANCE_NAME_RE.match(str(name)):
+        raise ValueError(f"Invalid instance name {name!r}, use letters, digits, '-' and '_'")
+    if name == DEFAULT_INSTANCE:
+        raise ValueError(f"'{DEFAULT_INSTANCE}' is configured with SONARR_API_URL and SONARR_API_KEY")
+    if not config.get("url"):
+        raise ValueError(f"Instance {name} needs a url")
+    return (
+        name,
+        config["url"],
+        config.get("api_key"),
+        int(config["max_connections"]) if config.get("max_connections") else None,
+        int(config["workers"]) if config.get("workers") else None,
+        float(config["cache_ttl"]) if config.get("cache_ttl") else None,
+        int(config["cache_size"]) if config.get("cache_size") else None,
+    )
+
+class SonarrInstances:
+    """
+    The Sonarr instances by name: DEFAULT_INSTANCE, from SONARR_API_URL and SONARR_API_KEY, and
+    the rows of the sonarr_instances table, read on first use and again when an unknown name is
+    asked for, e.g. one added through another worker process.
+    """
+
+    def __init__(self):
+        self.default = SonarrInstance(DEFAULT_INSTANCE, SONARR_API_URL, SONARR_API_KEY)
+        self._instances = {DEFAULT_INSTANCE: self.default}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the sonarr_instances table, keeping the pools and caches of unchanged instances."""
+        try:
+            rows = get_db().execute(f"SELECT {', '.join(INSTANCE_COLUMNS)} FROM sonarr_instances").fetchall()
+        except sqlite3.OperationalError:
+            # Not migrated yet, only the default instance exists
+            return
+        with self._lock:
+            instances = {DEFAULT_INSTANCE: self.default}
+            for row in rows:
+                current = self._instances.get(row[0])
+                instances[row[0]] = current if current and current.settings == tuple(row) else SonarrInstance(*row)
+            self._instances = instances
+            self._loaded = True
+
+    def get(self, name=None):
+        """The instance called name, the default one for None, or None when there is no such instance."""
+        if not name or name == DEFAULT_INSTANCE:
+            return self.default
+        if not self._loaded or name not in self._instances:
+            self.load()
+        return self._instances.get(name)
+
+    def all(self):
+        if not self._loaded:
+            self.load()
+        return list(self._instances.values())
+
+    def close(self):
+        """Close the pooled connections of every loaded instance, see SonarrClient.close."""
+        for instance in list(self._instances.values()):
+            instance.client.close()
+
+sonarr_instances = SonarrInstances()
+
+def store_sonarr_instances(rows):
+    """Store or update instances, given as sonarr_instances rows, and start using them."""
+    with db_transaction() as conn:
+        conn.executemany(f"""
+            INSERT OR REPLACE INTO sonarr_instances ({', '.join(INSTANCE_COLUMNS)})
+            VALUES ({', '.join('?' * len(INSTANCE_COLUMNS))})
+        """, rows)
+    sonarr_instances.load()
+
+def load_sonarr_instances(path=None):
+    """Copy the instances of SONARR_INSTANCES_FILE, when it exists, into the database and load them all."""
+    path = path or SONARR_INSTANCES_FILE
+    if os.path.exists(path):
+        with open(path) as f:
+            rows = [parse_instance_config(config) for config in json.load(f)]
+        store_sonarr_instances(rows)
+        logger.info(f"Loaded {len(rows)} Sonarr instances from {path}")
+    sonarr_instances.load()
+
+# Sonarr instance the current request or job works with, DEFAULT_INSTANCE unless one is selected
+_instance = ContextVar("sonarr_instance", default=None)
+
+def current_instance():
+    return _instance.get() or sonarr_instances.default
+
+@contextmanager
+def use_instance(instance):
+    """Work with another Sonarr instance for the duration of the block."""
+    token = _instance.set(instance)
+    try:
+        yield instance
+    finally:
+        _instance.reset(token)
+
+def in_current_instance(records):
+    """Iterate records under the current instance, for streamed bodies produced after the request ended."""
+    instance = current_instance()
+    def iterate():
+        with use_instance(instance):
+            yield from records
+    return iterate()
+
+def series_key(instance, series_id):
+    """Key of a series across instances: "123" on the default instance, "anime:123" on the others."""
+    return str(series_id) if instance == DEFAULT_INSTANCE else f"{instance}:{series_id}"
+
+def parse_series_key(key):
+    """(instance, series_id) of a series_key, a bare series id belonging to the default instance."""
+    instance, _, series_id = str(key).rpartition(":")
+    return instance or DEFAULT_INSTANCE, int(series_id)
+
+def normalize_series_key(key, instance=None):
+    """
+    The series_key of a key given by a client: "name:id" names its instance, a bare id is a
+    series of `instance`, of the default one without it.
+
+    Raises:
+        ValueError: When key is not a series key.
+    """
+    instance_name, series_id = parse_series_key(key)
+    return series_key(instance_name if ":" in str(key) else instance or DEFAULT_INSTANCE, series_id)
+
+def fetch_sonarr(cache_key, path, params=None):
+    """
+    Fetch a JSON payload from the current Sonarr instance through its cache.
+
+    Cached payloads are shared between requests and threads, so callers must not mutate them.
+    Raises SonarrError on a non-200 answer and requests.RequestException when Sonarr is unreachable.
+    """
+    instance = current_instance()
+    payload = instance.cache.get(cache_key)
+    if payload is not None:
+        return payload
+
+    response = instance.client.get(path, params=params)
+    if response.status_code != 200:
+        raise SonarrError(f"Sonarr answered {response.status_code} for {path}", response.status_code)
+    payload = response.json()
+    instance.cache.set(cache_key, payload)
+    return payload
+
+def fetch_series_list():
+    return fetch_sonarr(("series",), "/series")
+
+def fetch_series(series_id):
+    return fetch_sonarr(("series", series_id), f"/series/{series_id}")
+
+def fetch_episodes(series_id):
+    return fetch_sonarr(("episode", series_id), "/episode", params={"seriesId": series_id})
+
+def fetch_episode_files(series_id):
+    return fetch_sonarr(("episodefile", series_id), "/episodefile", params={"seriesId": series_id})
+
+def invalidate_series_cache(series_id):
+    """Drop every cached payload belonging to a series of the current instance."""
+    return current_instance().cache.invalidate(lambda key: len(key) == 2 and key[1] == series_id)
+
+SERIES_SEARCH_MODES = ("prefix", "substring", "fuzzy")
+
+class SeriesIndex:
+    """
+    Search index over a Sonarr series list, matching the title and the alternate titles.
+
+    Titles are compared casefolded. Prefix searches bisect the sorted titles, substring and
+    fuzzy searches scan them; a fuzzy query matches titles containing its characters in order.
+    The index is immutable and rebuilt whenever the cached series list changes.
+    """
+
+    def __init__(self, series_list):
+        self.payload = series_list
+        self.series = sorted(
+            ({"id": series["id"], "title": series["title"]} for series in series_list),
+            key=lambda series: (series["title"].casefold(), series["id"])
+        )
+        position = {series["id"]: index for index, series in enumerate(self.series)}
+        # (folded title, position in self.series), sorted for prefix searches
+        self.keys = sorted(
+            (title.casefold(), position[series["id"]])
+            for series in series_list
+            for title in {series["title"], *(alt["title"] for alt in series.get("alternateTitles", []))}
+        )
+        self._folded = [key for key, _ in self.keys]
+        # Searches match the alternate titles too, a change to them must change the ETag
+        self.version = hashlib.sha1(json.dumps([self.series, self.keys]).encode()).hexdigest()[:16]
+
+    def search(self, query, mode="substring"):
+        """
+        Return the series matching query, best matches first, or every series for an empty query.
+
+        Prefix matches are ordered by title, substring matches by where the query starts in the
+        title, fuzzy matches by how tightly the title contains the query.
+        """
+        query = query.casefold().strip()
+        if not query:
+            return self.series
+
+        if mode == "prefix":
+            start = bisect_left(self._folded, query)
+            scores = {}
+            for folded, index in self.keys[start:]:
+                if not folded.startswith(query):
+                    break
+                scores.setdefault(index, 0)
+        else:
+            if mode == "fuzzy":
+                pattern = re.compile(".*?".join(re.escape(char) for char in query))
+            scores = {}
+            for folded, index in self.keys:
+                if mode == "fuzzy":
+                    match = pattern.search(folded)
+                    score = (match.end() - match.start(), match.start()) if match else None
+                else:
+                    position = folded.find(query)
+                    score = position if position >= 0 else None
+                if score is not None and (index not in scores or score < scores[index]):
+                    scores[index] = score
+        return [self.series[index] for index in sorted(scores, key=lambda index: (scores[index], index))]
+
+def get_series_index():
+    """Return the search index of the current instance's cached series list, rebuilt when the list was fetched again."""
+    instance = current_instance()
+    series_list = fetch_series_list()
+    index = instance.series_index
+    if index is None or index.payload is not series_list:
+        with instance.series_index_lock:
+            if instance.series_index is None or instance.series_index.payload is not series_list:
+                instance.series_index = SeriesIndex(series_list)
+            index = instance.series_index
+    return index
+
+def episode_file_stamp(episode_file, path=None):
+    """Fingerprint of an episode file; changes when Sonarr imports a new file or the path moves."""
+    return f"{episode_file.get('dateAdded', '')}|{path or episode_file['path']}"
+
+def hash_settings(chosen_title, use_season_folders, use_absolute_numbering, rename_template=None):
+    """Hash the series settings that influence the generated paths."""
+    settings = [
+        chosen_title, bool(use_season_folders), bool(use_absolute_numbering),
+        rename_template or DEFAULT_RENAME_TEMPLATE
+    ]
+    return hashlib.sha1(json.dumps(settings).encode()).hexdigest()
+
+def hash_file_stamps(settings_hash, file_stamps):
+    """Hash a series' settings together with the stamps of all of its episode files."""
+    content = json.dumps([settings_hash, sorted(file_stamps.items())])
+    return hashlib.sha1(content.encode()).hexdigest()
+
+class TemplateError(ValueError):
+    """Raised when a rename template cannot be parsed."""
+
+def _audio_channels(media_info):
+    audio_channels = str(media_info.get("audioChannels") or "")
+    return "2.0" if audio_channels == "2" else audio_channels
+
+# Characters not allowed in file names on every filesystem Sonarr supports, replaced in token
+# values the way Sonarr does it; ": " becomes " - " first
+_FILENAME_CHARACTERS = str.maketrans(
+    {"\\": "+", "/": "+", "<": "", ">": "", "?": "!", "*": "-", "|": "", '"': "", ":": "-",
+     **{chr(code): None for code in range(32)}}
+)
+
+_FILENAME_CHARACTERS_RE = re.compile(r'[\\/<>?*|":\x00-\x1f]')
+
+# Titles, qualities and codecs repeat across the files of a library
+@lru_cache(maxsize=4096)
+def _clean_token_value(value):
+    """Make a token value safe to put in a file name, e.g. "Part 1/2" -> "Part 1+2"."""
+    if _FILENAME_CHARACTERS_RE.search(value) is None:
+        return value
+    return value.replace(": ", " - ").translate(_FILENAME_CHARACTERS)
+
+# Template tokens and the expression computing their value in a compiled template, which
+# receives (episode_file, chosen_title, episode_label, season, episode) as (f, title, label,
+# season, episode). media_info is looked up once per call when a template needs it.
+TEMPLATE_TOKENS = {
+    "Series Title": "title",
+    "episode": "label",
+    "season": "season",
+    "Episode Title": "(episode or {}).get('title')",
+    "Quality Full": "f['quality']['quality']['name']",
+    "Quality Title": "f['quality']['quality']['name']",
+    "MediaInfo VideoCodec": "media_info.get('videoCodec')",
+    "MediaInfo AudioCodec": "media_info.get('audioCodec')",
+    "MediaInfo AudioChannels": "_audio_channels(media_info)",
+    "Release Group": "f.get('releaseGroup')",
+}
+
+# Case filters, applied as the str method of the same name
+TEMPLATE_FILTERS = ("upper", "lower", "title")
+
+def _token_key(name):
+    """Token names are matched case-insensitively, ignoring spaces, underscores and dots."""
+    return re.sub(r"[ _.]", "", name).lower()
+
+_TEMPLATE_TOKEN_EXPRESSIONS = {_token_key(name): expression for name, expression in TEMPLATE_TOKENS.items()}
+
+# {<prefix><Token Name>[:<padding>][|<filter>...]<suffix>}; prefix and suffix are only
+# emitted when the token has a value, e.g. {[MediaInfo VideoCodec]} or {-Release Group}
+TEMPLATE_TOKEN_RE = re.compile(
+    r"(?P<prefix>[^A-Za-z0-9{}]*)"
+    r"(?P<name>[A-Za-z][A-Za-z0-9 _.]*?)"
+    r"(?::(?P<padding>\d+)d?)?"
+    r"(?P<filters>(?:\|[a-z]+)*)"
+    r"(?P<suffix>[^A-Za-z0-9{}|:]*)$"
+)
+
+def _parse_token(body):
+    """Parse the inside of a {...} token into (expression, width, filters, prefix, suffix)."""
+    match = TEMPLATE_TOKEN_RE.match(body)
+    if not match:
+        raise TemplateError(f"Invalid token: {{{body}}}")
+
+    expression = _TEMPLATE_TOKEN_EXPRESSIONS.get(_token_key(match.group("name")))
+    if expression is None:
+        raise TemplateError(f"Unknown token: {{{body}}}")
+
+    padding = match.group("padding")
+    # {episode:00} pads to the number of zeros, {episode:2} and {episode:02d} to the number given
+    width = (len(padding) if padding.strip("0") == "" else int(padding)) if padding else 0
+    filters = match.group("filters").split("|")[1:]
+    for filter_name in filters:
+        if filter_name not in TEMPLATE_FILTERS:
+            raise TemplateError(f"Unknown filter '{filter_name}' in {{{body}}}")
+    return expression, width, filters, match.group("prefix"), match.group("suffix")
+
+def _parse_template(template, pos=0, in_group=False):
+    """
+    Parse template from pos up to its end, or up to the closing '>' of a group.
+
+    Returns:
+        tuple: (parts, pos) where parts holds literal strings, token tuples and nested group lists.
+    """
+    parts = []
+    literal = []
+    while pos < len(template):
+        char = template[pos]
+        if char in "{}" and template.startswith(char * 2, pos):
+            literal.append(char)
+            pos += 2
+            continue
+        if char == "}":
+            raise TemplateError(f"Unmatched '}}' at position {pos}")
+        if char == ">" and in_group:
+            break
+        if char in "{<":
+            if literal:
+                parts.append("".join(literal))
+                literal = []
+            if char == "{":
+                end = template.find("}", pos)
+                if end == -1:
+                    raise TemplateError(f"Unclosed '{{' at position {pos}")
+                parts.append(_parse_token(template[pos + 1:end]))
+                pos = end + 1
+            else:
+                group, pos = _parse_template(template, pos + 1, True)
+                if pos >= len(template):
+                    raise TemplateError("Unclosed '<' group")
+                parts.append(group)
+                pos += 1
+            continue
+        literal.append(char)
+        pos += 1
+    if literal:
+        parts.append("".join(literal))
+    return parts, pos
+
+def _generate_parts(parts, statements, counter):
+    """Emit the statements rendering parts, returning (expressions to concatenate, token variables)."""
+    expressions = []
+    token_variables = []
+    for part in parts:
+        if isinstance(part, str):
+            expressions.append(repr(part))
+        elif isinstance(part, tuple):
+            expression, width, filters, prefix, suffix = part
+            variable = f"v{next(counter)}"
+            # Numbers need no cleaning
+            value = f"str({variable})" if expression in ("label", "season") else f"_clean_token_value(str({variable}))"
+            if width:
+                value += f".zfill({width})"
+            for filter_name in filters:
+                value += f".{filter_name}()"
+            if prefix:
+                value = f"{prefix!r} + {value}"
+            if suffix:
+                value = f"{value} + {suffix!r}"
+            statements.append(f"{variable} = {expression}")
+            statements.append(f"{variable} = '' if {variable} is None or {variable} == '' else {value}")
+            expressions.append(variable)
+            token_variables.append(variable)
+        else:
+            # A <...> group only renders when at least one of its tokens has a value
+            group_expressions, group_tokens = _generate_parts(part, statements, counter)
+            variable = f"g{next(counter)}"
+            condition = " or ".join(group_tokens) or "True"
+            statements.append(f"{variable} = ({' + '.join(group_expressions) or repr('')}) if {condition} else ''")
+            expressions.append(variable)
+            token_variables.append(variable)
+    return expressions, token_variables
+
+@lru_cache(maxsize=128)
+def compile_template(template):
+    """
+    Compile a rename template into a Python function, cached so each template is compiled once.
+
+    Templates use Sonarr-style tokens such as {Series Title}, {episode:00}, {Quality Full},
+    {MediaInfo VideoCodec}, {MediaInfo AudioCodec}, {MediaInfo AudioChannels}, {Release Group},
+    {season:00} and {Episode Title}. Characters written inside the braces before or after the
+    name are only emitted when the token has a value ({-Release Group}, {[MediaInfo VideoCodec]}),
+    |upper, |lower and |title change the case, and a <...> segment is dropped entirely when
+    none of its tokens has a value. {{ and }} produce literal braces. Characters not allowed in
+    file names, such as "/", are replaced in token values, see _clean_token_value.
+
+    Returns:
+        callable: render(episode_file, chosen_title, episode_label, season=None, episode=None) -> str
+    """
+    parts, _ = _parse_template(template)
+    statements = []
+    expressions, _ = _generate_parts(parts, statements, itertools.count())
+    if any("media_info" in statement for statement in statements):
+        statements.insert(0, "media_info = f.get('mediaInfo') or {}")
+    statements.append(f"return {' + '.join(expressions) or repr('')}")
+
+    # Token expressions and filters come from fixed tables and literals are repr()'d,
+    # so the generated source never contains text taken verbatim from the template
+    source = "def render(f, title, label, season=None, episode=None):\n" + "".join(
+        f"    {statement}\n" for statement in statements
+    )
+    namespace = {"_audio_channels": _audio_channels, "_clean_token_value": _clean_token_value}
+    exec(compile(source, f"<rename template {template!r}>", "exec"), namespace)
+    render = namespace["render"]
+    render.source = source
+    return render
+
+def generate_new_filename(episode_file, chosen_title, episode_label, file_extension, rename_template=None, season=None, episode=None):
+    """Generate a new filename based on the episode file details and the series' rename template."""
+    render = compile_template(rename_template or DEFAULT_RENAME_TEMPLATE)
+    return render(episode_file, chosen_title, episode_label, season, episode) + file_extension
+
+# Name of every token in Sonarr's naming format, by the expression of its TEMPLATE_TOKENS entry
+# (the first name wins where two share an expression, e.g. {Quality Full} and {Quality Title})
+_SONARR_TOKEN_NAMES = {expression: name for name, expression in reversed(TEMPLATE_TOKENS.items())}
+
+# Sonarr's naming setting for the episode files of each series type
+SONARR_NAMING_FIELDS = {
+    "standard": "standardEpisodeFormat",
+    "daily": "dailyEpisodeFormat",
+    "anime": "animeEpisodeFormat",
+}
+
+# Episode numbering Sonarr requires in the naming format of a series type, as Sonarr matches it
+_SONARR_SEASON_EPISODE_RE = re.compile(r"s?\{season(?::0+)?\}[- ._]?[ex]\{episode(?::0+)?\}", re.IGNORECASE)
+_SONARR_ABSOLUTE_RE = re.compile(r"\{absolute(?::0+)?\}", re.IGNORECASE)
+_SONARR_AIR_DATE_RE = re.compile(r"\{Air(?:\s|\W|_)Date\}", re.IGNORECASE)
+
+def check_sonarr_naming_format(naming_format, series_type):
+    """
+    Check a naming format against the rules Sonarr applies to the format of a series type.
+
+    Standard series need the season followed by the episode ({season:00}E{episode:00} or
+    {season}x{episode:00}), anime series that or {absolute}, daily series an {Air-Date}, which
+    rename templates have no token for.
+
+    Raises:
+        TemplateError: When Sonarr would refuse the format.
+    """
+    season_episode = _SONARR_SEASON_EPISODE_RE.search(naming_format)
+    if series_type == "standard" and not season_episode:
+        raise TemplateError(
+            "The Sonarr backend needs the season and episode, e.g. S{season:00}E{episode:00}, in the template of standard series"
+        )
+    if series_type == "anime" and not (season_episode or _SONARR_ABSOLUTE_RE.search(naming_format)):
+        raise TemplateError(
+            "The Sonarr backend needs absolute numbering, or the season and episode, in the template of anime series"
+        )
+    if series_type == "daily" and not _SONARR_AIR_DATE_RE.search(naming_format):
+        raise TemplateError("The Sonarr backend does not support daily series, templates have no air date")
+    if series_type not in SONARR_NAMING_FIELDS:
+        raise TemplateError(f"The Sonarr backend does not support {series_type} series")
+
+def sonarr_naming_format(template, chosen_title, use_absolute_numbering, series_type=None):
+    """
+    Translate a rename template into a Sonarr episode naming format, for the "sonarr" backend.
+
+    {Series Title} becomes the chosen title itself, since Sonarr would use the series' own title,
+    and {episode} becomes {absolute} with absolute numbering. Sonarr expresses case by the case of
+    the token name, so |upper and |lower are kept while |title is only supported on the title.
+    Sonarr has no equivalent of <...> groups or literal braces.
+
+    Args:
+        series_type (str, optional): Sonarr's seriesType of the series, whose rules the format
+            must meet, see check_sonarr_naming_format. Not checked when None.
+
+    Raises:
+        TemplateError: When the template or the title cannot be expressed in Sonarr's format.
+    """
+    if "{" in chosen_title or "}" in chosen_title:
+        raise TemplateError("The Sonarr backend does not support titles containing braces")
+
+    parts, _ = _parse_template(template)
+    naming = []
+    for part in parts:
+        if isinstance(part, list):
+            raise TemplateError("The Sonarr backend does not support <...> groups")
+        if isinstance(part, str):
+            if "{" in part or "}" in part:
+                raise TemplateError("The Sonarr backend does not support literal braces")
+            naming.append(part)
+            continue
+
+        expression, width, filters, prefix, suffix = part
+        if expression == "title":
+            value = _clean_token_value(chosen_title)
+            for filter_name in filters:
+                value = getattr(value, filter_name)()
+            naming.append(f"{prefix}{value}{suffix}" if value else "")
+            continue
+
+        if "title" in filters:
+            raise TemplateError("The Sonarr backend only supports |title on {Series Title}")
+        name = _SONARR_TOKEN_NAMES[expression]
+        if expression == "label":
+            name = "absolute" if use_absolute_numbering else "episode"
+        if filters:
+            name = getattr(name, filters[-1])()
+        padding = f":{'0' * width}" if width else ""
+        naming.append(f"{{{prefix}{name}{padding}{suffix}}}")
+    naming_format = "".join(naming)
+    if series_type is not None:
+        check_sonarr_naming_format(naming_format, series_type)
+    return naming_format
+
+def check_rename_backend(rename_backend, chosen_title, use_absolute_numbering, rename_template=None, series_type=None):
+    """
+    Return why a series' settings cannot be renamed by its backend, or None when they can.
+    The naming rules Sonarr has for the series type are only checked when series_type is given.
+    """
+    if rename_backend is not None and rename_backend not in RENAME_BACKENDS:
+        return f"Unknown rename backend '{rename_backend}', expected one of {', '.join(RENAME_BACKENDS)}"
+    if (rename_backend or RENAME_BACKEND) == "sonarr":
+        try:
+            sonarr_naming_format(
+                rename_template or DEFAULT_RENAME_TEMPLATE, chosen_title, use_absolute_numbering, series_type
+            )
+        except TemplateError as e:
+            return str(e)
+    return None
+
+# Season folders as Sonarr and most libraries name them: "Season 01", "Season 1", "season.2",
+# "Season 100 (2024)" and "Specials"
+SEASON_FOLDER_RE = re.compile(r"^(?:season[ ._-]*\d+|specials)\b", re.IGNORECASE)
+
+@lru_cache(maxsize=4096)
+def is_season_folder(directory):
+    """
+    Whether the last component of a directory is a season folder.
+
+    Memoized per directory, every file of a season shares the result.
+    """
+    return SEASON_FOLDER_RE.match(os.path.basename(directory)) is not None
+
+def determine_new_path(current_path, new_filename, season, use_season_folders):
+    """Determine the new path based on the current path and folder structure preference."""
+    current_dir = os.path.dirname(current_path)
+    current_in_season = is_season_folder(current_dir)
+    
+    if use_season_folders:
+        if current_in_season:
+            # If already in season folder, keep it there
+            new_path = os.path.join(current_dir, new_filename)
+        else:
+            # If not in season folder, create season folder structure
+            base_dir = os.path.dirname(current_path)
+            new_path = os.path.join(base_dir, f"Season {int(season):02d}", new_filename)
+    else:
+        if current_in_season:
+            # If currently in season folder but moving to single folder, place in parent directory
+            new_path = os.path.join(os.path.dirname(os.path.dirname(current_path)), new_filename)
+        else:
+            # If already in single folder, keep it there
+            new_path = os.path.join(current_dir, new_filename)
+    
+    return new_path
+
+def prepare_directory(directory, UID, GID):
+    """Create a target directory if needed and set its permissions."""
+    os.makedirs(directory, exist_ok=True)
+    os.chmod(directory, 0o2775)
+    os.chown(directory, UID, GID)
+
+def rename_file(current_path, new_path, UID, GID, prepare_dir=True):
+    """Rename a file and set permissions."""
+    # Create any necessary directories, unless the batch planner already did
+    if prepare_dir:
+        prepare_directory(os.path.dirname(new_path), UID, GID)
+    # Rename the file
+    os.rename(current_path, new_path)
+    os.chown(new_path, UID, GID)
+    logger.info(f"File renamed: {current_path} -> {new_path}")
+    return {"status": "renamed", "message": "File renamed successfully."}
+
+class RenameConflictError(Exception):
+    """Raised when a batch of renames cannot be carried out safely; nothing has been touched yet."""
+
+    def __init__(self, conflicts):
+        super().__init__(f"{len(conflicts)} rename conflict(s), nothing was renamed")
+        self.conflicts = conflicts
+
+# Metadata syscalls per file of the former rename_file: makedirs, chmod and chown of the
+# target directory, then rename and chown of the file
+LEGACY_SYSCALLS_PER_FILE = 5
+
+def plan_rename_batch(moves):
+    """
+    Plan a batch of (old_path, new_path) moves before anything touches the disk.
+
+    Fails fast on two files renamed to the same path and on targets already taken by a file
+    that is not moved away in the same batch. A move whose source is gone and whose target
+    exists was carried out by an earlier run that Sonarr has not rescanned yet, it is left out.
+    Moves are ordered so a file is only moved once its target has been vacated, and cycles
+    such as a two-way swap (A -> B while B -> A) go through a temporary name.
+
+    Returns:
+        dict: "operations", the ordered moves as dicts with old, new and item (the index of the
+        move they complete, None for the first leg of a cycle); "already_moved", the indexes of
+        the moves left out; "directories", each distinct target directory to prepare once;
+        "syscalls", the planned metadata syscalls against what the former per-file
+        implementation needed.
+    """
+    conflicts = []
+    by_source = {}
+    targets = {}
+    done = set()
+    for index, (old_path, new_path) in enumerate(moves):
+        if old_path == new_path:
+            done.add(index)
+        elif old_path in by_source:
+            conflicts.append({"old": old_path, "new": new_path, "reason": "duplicate_source"})
+        elif new_path in targets:
+            conflicts.append({
+                "old": old_path, "new": new_path, "reason": "duplicate_target",
+                "other": moves[targets[new_path]][0]
+            })
+        else:
+            by_source[old_path] = index
+            targets[new_path] = index
+    already_moved = []
+    for index, (old_path, new_path) in enumerate(moves):
+        # A taken target is fine when the file occupying it is moved away first
+        if old_path != new_path and new_path not in by_source and os.path.lexists(new_path):
+            if os.path.lexists(old_path):
+                conflicts.append({"old": old_path, "new": new_path, "reason": "target_exists"})
+            else:
+                already_moved.append(index)
+                done.add(index)
+    if conflicts:
+        raise RenameConflictError(conflicts)
+
+    operations = []
+    for start in range(len(moves)):
+        if start in done:
+            continue
+        # Follow the chain of moves whose target is the source of another one
+        chain = []
+        index = start
+        while index is not None and index not in done and index not in chain:
+            chain.append(index)
+            index = by_source.get(moves[index][1])
+
+        if index is not None and index in chain:
+            # Every file of a cycle waits on the next one: park the first file under a temporary name
+            old_path, new_path = moves[chain[0]]
+            temp_path = f"{old_path}.renamerr-tmp"
+            while os.path.lexists(temp_path) or temp_path in by_source:
+                temp_path += "~"
+            operations.append({"old": old_path, "new": temp_path, "item": None})
+            operations.extend({"old": moves[i][0], "new": moves[i][1], "item": i} for i in reversed(chain[1:]))
+            operations.append({"old": temp_path, "new": new_path, "item": chain[0]})
+        else:
+            # The last move of the chain targets a free path, run the chain backwards
+            operations.extend({"old": moves[i][0], "new": moves[i][1], "item": i} for i in reversed(chain))
+        done.update(chain)
+
+    directories = sorted({os.path.dirname(op["new"]) for op in operations if op["item"] is not None})
+    return {
+        "operations": operations,
+        "already_moved": already_moved,
+        "directories": directories,
+        "syscalls": {
+            "planned": 3 * len(directories) + 2 * len(operations),
+            "legacy": LEGACY_SYSCALLS_PER_FILE * len(by_source),
+        },
+    }
+
+class DiskSnapshot:
+    """
+    Directory listings and filesystem details of the directories a rename plan touches.
+
+    Every directory is listed once with os.scandir and its device and free inodes are read
+    once, instead of one stat per file.
+    """
+
+    def __init__(self):
+        self._listings = {}
+        self._devices = {}
+        self._free_inodes = {}
+
+    def listing(self, directory):
+        """Names in directory, or None when it does not exist."""
+        if directory not in self._listings:
+            try:
+                with os.scandir(directory) as entries:
+                    self._listings[directory] = {entry.name for entry in entries}
+            except (FileNotFoundError, NotADirectoryError):
+                self._listings[directory] = None
+        return self._listings[directory]
+
+    def exists(self, path):
+        names = self.listing(os.path.dirname(path))
+        return names is not None and os.path.basename(path) in names
+
+    def existing_ancestor(self, directory):
+        """directory itself when it exists, else its closest existing parent."""
+        while self.listing(directory) is None and os.path.dirname(directory) != directory:
+            directory = os.path.dirname(directory)
+        return directory
+
+    def device(self, directory):
+        """Device of directory, or of the closest existing parent the directory would be created in."""
+        directory = self.existing_ancestor(directory)
+        if directory not in self._devices:
+            self._devices[directory] = os.stat(directory).st_dev
+        return self._devices[directory]
+
+    def free_inodes(self, directory):
+        """Inodes available on directory's filesystem, None when the filesystem does not count them."""
+        device = self.device(directory)
+        if device not in self._free_inodes:
+            stats = os.statvfs(self.existing_ancestor(directory))
+            self._free_inodes[device] = stats.f_favail if stats.f_files else None
+        return self._free_inodes[device]
+
+# Why a planned rename is not carried out, by verification result
+VERIFICATION_MESSAGES = {
+    "source_missing": "the file is not on disk anymore",
+    "target_exists": "another file already has the new name",
+    "cross_device": "the new folder is on another filesystem",
+    "no_free_inodes": "no free inodes left to create the new folder",
+}
+
+class RenameVerifier:
+    """
+    Check planned renames against the disk before anything is moved.
+
+    verify() annotates a preview entry with "verified" and "verification": "ok",
+    "already_moved" (the source is gone and the target exists, a rename Sonarr has not
+    rescanned yet), or one of the VERIFICATION_MESSAGES reasons. Targets taken by a file that
+    the same batch moves away count as free. Folders to create are counted against the free
+    inodes of their filesystem over the whole batch.
+
+    Args:
+        moving (set): Current paths of every file renamed by the batch.
+    """
+
+    def __init__(self, moving):
+        self.moving = moving
+        self.disk = DiskSnapshot()
+        self._new_directories = set()
+        self._inodes_needed = {}
+
+    def verify(self, entry):
+        current_path, new_path = entry["current"], entry["new"]
+        current_dir, new_dir = os.path.dirname(current_path), os.path.dirname(new_path)
+        if not self.disk.exists(current_path):
+            result = "already_moved" if self.disk.exists(new_path) else "source_missing"
+        elif new_path != current_path and new_path not in self.moving and self.disk.exists(new_path):
+            result = "target_exists"
+        elif self.disk.device(current_dir) != self.disk.device(new_dir):
+            # os.rename cannot move across filesystems, and a copy would not be atomic
+            result = "cross_device"
+        else:
+            result = self._reserve_directories(new_dir)
+        entry["verified"] = result == "ok"
+        entry["verification"] = result
+        return entry
+
+    def _reserve_directories(self, directory):
+        missing = []
+        ancestor = self.disk.existing_ancestor(directory)
+        while directory != ancestor and directory not in self._new_directories:
+            missing.append(directory)
+            directory = os.path.dirname(directory)
+        if not missing:
+            return "ok"
+        device = self.disk.device(ancestor)
+        free = self.disk.free_inodes(ancestor)
+        needed = self._inodes_needed.get(device, 0) + len(missing)
+        if free is not None and needed > free:
+            return "no_free_inodes"
+        self._inodes_needed[device] = needed
+        self._new_directories.update(missing)
+        return "ok"
+
+def _chained_moves(moves):
+    """
+    Indexes of the (old_path, new_path) moves whose source is the target of another move, or
+    whose target is the source of another one. Both sides of such a move exist before and after
+    it, so only the journal can tell whether it happened.
+    """
+    sources = {old_path for old_path, new_path in moves}
+    targets = {new_path for old_path, new_path in moves}
+    return {
+        index for index, (old_path, new_path) in enumerate(moves)
+        if old_path in targets or new_path in sources
+    }
+
+class RenameBatch:
+    """
+    Write-ahead journal of one batch of renames, used as a context manager around its execution.
+
+    Every planned move is recorded in a single transaction before the first file is touched.
+    Completed moves are marked done JOURNAL_FLUSH_SIZE at a time rather than with one fsync
+    per file; recovery checks on disk which side of those moves exists. Chained moves, whose
+    disk state is ambiguous, are marked done right away and recovery goes by those marks. The batch ends up "completed", or
+    "failed" when execution stopped early.
+    """
+
+    def __init__(self, series_id, moves):
+        self.series_id = series_id
+        self.moves = moves
+        self.id = None
+        self._done = []
+        self._chained = _chained_moves(moves)
+
+    def __enter__(self):
+        if self.moves:
+            with db_transaction() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO rename_batches (instance, series_id, status) VALUES (?, ?, 'pending')",
+                    (current_instance().name, self.series_id)
+                )
+                self.id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO rename_journal (batch_id, seq, old_path, new_path) VALUES (?, ?, ?, ?)",
+                    [(self.id, seq, old_path, new_path) for seq, (old_path, new_path) in enumerate(self.moves)]
+                )
+        return self
+
+    def mark_done(self, seq):
+        self._done.append(seq)
+        if seq in self._chained or len(self._done) >= JOURNAL_FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self, status=None):
+        with db_transaction() as conn:
+            conn.executemany(
+                "UPDATE rename_journal SET state = 'done' WHERE batch_id = ? AND seq = ?",
+                [(self.id, seq) for seq in self._done]
+            )
+            if status:
+                conn.execute(
+                    "UPDATE rename_batches SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (status, self.id)
+                )
+        self._done = []
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.id is not None:
+            self._flush("completed" if exc_type is None else "failed")
+            if exc_type is not None:
+                logger.error(f"Rename batch {self.id} stopped early")
+        return False
+
+# Serializes recovery and undo, so a batch is never reverted twice at the same time
+journal_lock = threading.Lock()
+
+def get_rename_batch(batch_id, with_entries=False):
+    """Retrieve a rename batch, with its journal entries when with_entries is set."""
+    row = get_db().execute("""
+        SELECT b.id, b.series_id, b.status, b.created_at, b.finished_at,
+               COUNT(j.seq), SUM(j.state = 'done'), SUM(j.state = 'undone'), b.instance
+        FROM rename_batches b LEFT JOIN rename_journal j ON j.batch_id = b.id
+        WHERE b.id = ? GROUP BY b.id
+    """, (batch_id,)).fetchone()
+    if not row or row[0] is None:
+        return None
+
+    batch = {
+        "id": row[0],
+        "series_id": row[1],
+        "status": row[2],
+        "created_at": row[3],
+        "finished_at": row[4],
+        "moves": row[5],
+        "done": row[6] or 0,
+        "undone": row[7] or 0,
+        "instance": row[8],
+    }
+    if with_entries:
+        batch["entries"] = [
+            {"seq": seq, "old": old_path, "new": new_path, "state": state}
+            for seq, old_path, new_path, state in get_db().execute(
+                "SELECT seq, old_path, new_path, state FROM rename_journal WHERE batch_id = ? ORDER BY seq",
+                (batch_id,)
+            )
+        ]
+    return batch
+
+def _journal_entries(batch_id):
+    return get_db().execute(
+        "SELECT seq, old_path, new_path, state FROM rename_journal WHERE batch_id = ? ORDER BY seq",
+        (batch_id,)
+    ).fetchall()
+
+def _is_moved(old_path, new_path):
+    """Whether a journaled move happened, judged from the disk rather than the journal marks."""
+    return os.path.lexists(new_path) and not os.path.lexists(old_path)
+
+def _journal_moves(batch_id):
+    """
+    Journal entries of a batch as (seq, old_path, new_path, state, moved) tuples. Whether a
+    chained move happened comes from its journal mark, the disk cannot tell; for the other
+    moves it comes from the disk.
+    """
+    entries = _journal_entries(batch_id)
+    chained = _chained_moves([(old_path, new_path) for _, old_path, new_path, _ in entries])
+    return [
+        (seq, old_path, new_path, state, state == "done" if index in chained else _is_moved(old_path, new_path))
+        for index, (seq, old_path, new_path, state) in enumerate(entries)
+    ]
+
+def _finish_recovery(batch_id, series_id, status, state, seqs):
+    with db_transaction() as conn:
+        conn.executemany(
+            "UPDATE rename_journal SET state = ? WHERE batch_id = ? AND seq = ?",
+            [(state, batch_id, seq) for seq in seqs]
+        )
+        conn.execute(
+            "UPDATE rename_batches SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (status, batch_id)
+        )
+    rescan_status = "not_triggered"
+    if seqs and series_id:
+        invalidate_series_cache(series_id)
+        rescan_status = trigger_rescan(series_id)
+    return rescan_status
+
+def revert_rename_batch(batch_id, series_id, status):
+    """
+    Move every file of a batch back to its original path, last move first. A file is never
+    moved onto a path that exists.
+
+    Returns:
+        dict: How many files were reverted, the ones that could not be, and the rescan status.
+    """
+    reverted = []
+    failed = []
+    for seq, old_path, new_path, state, moved in reversed(_journal_moves(batch_id)):
+        if state == "undone" or not moved:
+            continue
+        if os.path.lexists(old_path):
+            logger.error(f"Failed to restore {new_path}: {old_path} exists")
+            failed.append({"old": old_path, "new": new_path, "error": "original path exists"})
+            continue
+        try:
+            os.rename(new_path, old_path)
+            reverted.append(seq)
+            logger.info(f"File restored: {new_path} -> {old_path}")
+        except OSError as e:
+            logger.error(f"Failed to restore {new_path}: {str(e)}")
+            failed.append({"old": old_path, "new": new_path, "error": str(e)})
+
+    rescan_status = _finish_recovery(batch_id, series_id, status, "undone", reverted)
+    return {"reverted": len(reverted), "failed": failed, "rescan_status": rescan_status}
+
+def resume_rename_batch(batch_id, series_id, UID, GID):
+    """
+    Carry out the moves of an interrupted batch that did not happen yet, in their planned order.
+    A move whose target exists is left out, and the batch ends up "failed" instead of "completed".
+
+    Returns:
+        int: How many files were renamed.
+    """
+    resumed = 0
+    done = []
+    blocked = 0
+    for seq, old_path, new_path, state, moved in _journal_moves(batch_id):
+        if not moved:
+            if not os.path.lexists(old_path):
+                continue
+            if os.path.lexists(new_path):
+                logger.error(f"Not resuming {old_path} -> {new_path}: the target exists")
+                blocked += 1
+                continue
+            rename_file(old_path, new_path, UID, GID)
+            resumed += 1
+        done.append(seq)
+
+    _finish_recovery(batch_id, series_id, "failed" if blocked else "completed", "done", done)
+    return resumed
+
+def roll_back_failed_batch(batch_id, series_id):
+    """
+    Move the files of a batch that stopped early back, so Sonarr is not left with a half renamed
+    series. Files that cannot be moved back stay renamed, and the series is rescanned so Sonarr
+    finds them.
+
+    Returns:
+        dict: "rolled_back", the number of files moved back, and "rescan_status".
+    """
+    reverted, failed = 0, True
+    rescan_status = "not_triggered"
+    try:
+        with journal_lock:
+            result = revert_rename_batch(batch_id, series_id, "rolled_back")
+        reverted, failed, rescan_status = result["reverted"], result["failed"], result["rescan_status"]
+        logger.warning(f"Rolled back rename batch {batch_id}: {reverted} files restored, {len(failed)} could not be")
+    except Exception as e:
+        logger.error(f"Failed to roll back rename batch {batch_id}: {str(e)}")
+
+    if series_id:
+        invalidate_series_cache(series_id)
+        if failed and rescan_status == "not_triggered":
+            rescan_status = trigger_rescan(series_id)
+    return {"rolled_back": reverted, "rescan_status": rescan_status}
+
+def recover_rename_journal(mode=None):
+    """
+    Handle the batches left "pending" by a process that stopped in the middle of renaming,
+    then prune finished batches older than JOURNAL_RETENTION_DAYS. Sonarr naming settings left
+    changed by the "sonarr" backend are restored first.
+
+    Args:
+        mode (str, optional): "rollback" restores the original paths, "resume" finishes the batch.
+            Defaults to JOURNAL_RECOVERY.
+    """
+    mode = mode or JOURNAL_RECOVERY
+    UID = int(os.getenv("PUID", 1000))
+    GID = int(os.getenv("PGID", 100))
+
+    recover_sonarr_naming()
+
+    with journal_lock:
+        pending = get_db().execute(
+            "SELECT id, instance, series_id FROM rename_batches WHERE status = 'pending' ORDER BY id"
+        ).fetchall()
+        for batch_id, instance_name, series_id in pending:
+            instance = sonarr_instances.get(instance_name)
+            if instance is None:
+                logger.error(f"Not recovering rename batch {batch_id}: Sonarr instance {instance_name} is not configured")
+                continue
+            try:
+                with use_instance(instance):
+                    if mode == "resume":
+                        resumed = resume_rename_batch(batch_id, series_id, UID, GID)
+                        logger.warning(f"Resumed interrupted rename batch {batch_id}: {resumed} files renamed")
+                    else:
+                        result = revert_rename_batch(batch_id, series_id, "rolled_back")
+                        logger.warning(f"Rolled back interrupted rename batch {batch_id}: {result['reverted']} files restored")
+            except Exception as e:
+                logger.error(f"Failed to recover rename batch {batch_id}: {str(e)}")
+
+        with db_transaction() as conn:
+            conn.execute(
+                "DELETE FROM rename_batches WHERE status != 'pending' AND created_at < datetime('now', ?)",
+                (f"-{JOURNAL_RETENTION_DAYS} days",)
+            )
+
+    # Recovery may run in a process about to fork its workers, do not leave rescans waiting
+    rescan_scheduler.flush()
+
+def trigger_rescan(series_id):
+    """Schedule a Sonarr rescan of a series, returning "scheduled", or "success"/"failed" when sent right away."""
+    if RESCAN_DEBOUNCE <= 0:
+        return send_rescan(series_id)
+    return rescan_scheduler.schedule(series_id)
+
+def send_rescan(series_id):
+    """Ask Sonarr to rescan a series now, returning "success" or "failed"."""
+    try:
+        rescan_response = current_instance().client.post("/command", {
+            "name": "RescanSeries",
+            "seriesId": series_id
+        })
+        return "success" if rescan_response.status_code == 201 else "failed"
+    except requests.RequestException as e:
+        logger.error(f"Failed to trigger rescan for series {series_id}: {str(e)}")
+        return "failed"
+
+# Terminal states of a Sonarr command
+SONARR_COMMAND_DONE = {"completed", "failed", "aborted", "cancelled", "orphaned"}
+
+def run_sonarr_command(payload):
+    """
+    Queue a Sonarr command and wait until it has finished.
+
+    Returns:
+        dict: The command as Sonarr last reported it.
+
+    Raises:
+        SonarrError: When the command cannot be queued, does not complete or times out.
+    """
+    client = current_instance().client
+    response = client.post("/command", payload)
+    if response.status_code != 201:
+        raise SonarrError(f"Sonarr answered {response.status_code} for the {payload['name']} command", response.status_code)
+    command = response.json()
+
+    deadline = time.monotonic() + SONARR_COMMAND_TIMEOUT
+    while command.get("status") not in SONARR_COMMAND_DONE:
+        if time.monotonic() > deadline:
+            raise SonarrError(f"{payload['name']} command {command['id']} did not finish in time", 504)
+        time.sleep(SONARR_COMMAND_POLL_INTERVAL)
+        response = client.get(f"/command/{command['id']}")
+        if response.status_code != 200:
+            raise SonarrError(f"Sonarr answered {response.status_code} for command {command['id']}", response.status_code)
+        command = response.json()
+
+    if command["status"] != "completed":
+        raise SonarrError(f"{payload['name']} command {command['id']} ended as {command['status']}", 502)
+    return command
+
+# A naming claim older than this was left by a process that stopped without releasing it
+SONARR_NAMING_CLAIM_TIMEOUT = 2 * SONARR_COMMAND_TIMEOUT
+
+def put_sonarr_naming(naming):
+    """Replace the current instance's naming settings, raising SonarrError when Sonarr refuses them."""
+    response = current_instance().client.put(f"/config/naming/{naming['id']}", naming)
+    if response.status_code not in (200, 202):
+        raise SonarrError(f"Sonarr answered {response.status_code} for /config/naming", response.status_code)
+
+@contextmanager
+def claim_sonarr_naming():
+    """
+    Claim the current instance's naming settings for a rename, across all processes sharing
+    the database, and restore them when the claim is released.
+
+    The claim is a sonarr_naming_claims row, which also saves the original naming before the
+    caller changes it, so recover_sonarr_naming can restore it after a crash. A claim older than
+    SONARR_NAMING_CLAIM_TIMEOUT is taken over along with the naming it saved.
+
+    Yields:
+        dict: Sonarr's original naming settings.
+
+    Raises:
+        SonarrError: When Sonarr cannot be read, or another rename holds the claim for longer
+            than SONARR_COMMAND_TIMEOUT.
+    """
+    instance = current_instance()
+    owner = f"{os.getpid()}:{threading.get_ident()}"
+    deadline = time.monotonic() + SONARR_COMMAND_TIMEOUT
+    while True:
+        with db_transaction() as conn:
+            claim = conn.execute(
+                "SELECT naming, claimed_at < datetime('now', ?) FROM sonarr_naming_claims WHERE instance = ?",
+                (f"-{SONARR_NAMING_CLAIM_TIMEOUT} seconds", instance.name)
+            ).fetchone()
+            if claim is None:
+                conn.execute("INSERT INTO sonarr_naming_claims (instance, owner) VALUES (?, ?)", (instance.name, owner))
+                saved = None
+                break
+            if claim[1]:
+                conn.execute(
+                    "UPDATE sonarr_naming_claims SET owner = ?, claimed_at = CURRENT_TIMESTAMP WHERE instance = ?",
+                    (owner, instance.name)
+                )
+                logger.warning(f"Took over the stale Sonarr naming claim of instance {instance.name}")
+                saved = claim[0]
+                break
+        if time.monotonic() >= deadline:
+            raise SonarrError(f"Sonarr naming settings of instance {instance.name} are in use by another rename", 504)
+        time.sleep(SONARR_COMMAND_POLL_INTERVAL)
+
+    naming = None
+    try:
+        if saved is None:
+            response = instance.client.get("/config/naming")
+            if response.status_code != 200:
+                raise SonarrError(f"Sonarr answered {response.status_code} for /config/naming", response.status_code)
+            naming = response.json()
+            with db_transaction() as conn:
+                conn.execute(
+                    "UPDATE sonarr_naming_claims SET naming = ? WHERE instance = ? AND owner = ?",
+                    (json.dumps(naming), instance.name, owner)
+                )
+        else:
+            # A stale claim saved Sonarr's naming from before the rename that left it
+            naming = json.loads(saved)
+        yield naming
+    finally:
+        try:
+            if naming is not None:
+                put_sonarr_naming(naming)
+        except Exception as e:
+            # Keep the claim, startup or the next stale takeover restores the naming
+            logger.error(f"Failed to restore the Sonarr naming settings of instance {instance.name}: {str(e)}")
+        else:
+            with db_transaction() as conn:
+                conn.execute(
+                    "DELETE FROM sonarr_naming_claims WHERE instance = ? AND owner = ?", (instance.name, owner)
+                )
+
+def recover_sonarr_naming():
+    """Restore the Sonarr naming settings saved by the claims of a process that stopped mid-rename."""
+    claims = get_db().execute("SELECT instance, owner, naming FROM sonarr_naming_claims").fetchall()
+    for instance_name, owner, naming in claims:
+        instance = sonarr_instances.get(instance_name)
+        if instance is None:
+            logger.error(f"Not restoring the naming settings of Sonarr instance {instance_name}: it is not configured")
+            continue
+        try:
+            if naming is not None:
+                with use_instance(instance):
+                    put_sonarr_naming(json.loads(naming))
+                logger.warning(f"Restored the naming settings of Sonarr instance {instance_name} left by an interrupted rename")
+        except Exception as e:
+            logger.error(f"Failed to restore the naming settings of Sonarr instance {instance_name}: {str(e)}")
+            continue
+        with db_transaction() as conn:
+            conn.execute(
+                "DELETE FROM sonarr_naming_claims WHERE instance = ? AND owner = ?", (instance_name, owner)
+            )
+
+def rename_with_sonarr(series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, file_ids):
+    """
+    Rename episode files with Sonarr's own RenameFiles command, the "sonarr" rename backend.
+
+    The series' template is set as Sonarr's episode naming format of the series' type for the
+    duration of the command and the previous naming is restored afterwards, see
+    claim_sonarr_naming. Sonarr moves the files
+    and updates its database in place, so no rescan is needed. The series' season folder
+    setting is updated to match.
+
+    Returns:
+        dict: Mapping of file_id -> the episode file as Sonarr reports it after the rename.
+
+    Raises:
+        SonarrError: When Sonarr rejects a request or the command fails.
+        TemplateError: When the template cannot be expressed in Sonarr's naming format.
+    """
+    instance = current_instance()
+    sonarr = instance.client
+    series = fetch_series(series_id)
+    series_type = series.get("seriesType") or "standard"
+    naming_format = sonarr_naming_format(
+        rename_template or DEFAULT_RENAME_TEMPLATE, chosen_title, use_absolute_numbering, series_type
+    )
+    if series.get("seasonFolder") != bool(use_season_folders):
+        # Copy the cached payload before changing it
+        response = sonarr.put(f"/series/{series_id}", dict(series, seasonFolder=bool(use_season_folders)))
+        if response.status_code not in (200, 202):
+            raise SonarrError(f"Sonarr answered {response.status_code} for series {series_id}", response.status_code)
+
+    # The lock keeps this process' threads off the database, the claim holds across processes
+    with instance.naming_lock, claim_sonarr_naming() as naming:
+        # Only the format of the series' type: Sonarr checks the others against their own rules
+        renaming = dict(
+            naming,
+            renameEpisodes=True,
+            seasonFolderFormat="Season {season:00}",
+            **{SONARR_NAMING_FIELDS[series_type]: naming_format},
+        )
+        put_sonarr_naming(renaming)
+        try:
+            run_sonarr_command({"name": "RenameFiles", "seriesId": series_id, "files": list(file_ids)})
+        finally:
+            # Even a failed command may have renamed some of the files
+            invalidate_series_cache(series_id)
+
+    return {file["id"]: file for file in fetch_episode_files(series_id)}
+
+JOB_COLUMNS = (
+    "id", "kind", "status", "files_done", "files_total", "series_done", "series_total",
+    "current_series", "eta_seconds", "result", "created_at", "started_at", "updated_at", "finished_at"
+)
+
+def get_job(job_id):
+    """Retrieve a background job with its progress, and its result once finished."""
+    row = get_db().execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    job["current_series"] = json.loads(job["current_series"]) if job["current_series"] else []
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+class JobProgress:
+    """
+    Progress of a running job, written to its row at most every JOB_PROGRESS_INTERVAL seconds.
+
+    The ETA extrapolates the elapsed time from the completed fraction: series for sweeps,
+    files for a single series.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.files_done = 0
+        self.files_total = 0
+        self.series_done = 0
+        self.series_total = 0
+        self.current_series = []
+        self._started = time.monotonic()
+        self._written = 0.0
+
+    def eta_seconds(self):
+        if self.series_total:
+            fraction = self.series_done / self.series_total
+        elif self.files_total:
+            fraction = self.files_done / self.files_total
+        else:
+            return None
+        if not fraction:
+            return None
+        return round((time.monotonic() - self._started) * (1 - fraction) / fraction, 1)
+
+    def save(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._written < JOB_PROGRESS_INTERVAL:
+            return
+        self._written = now
+        with db_transaction() as conn:
+            conn.execute("""
+                UPDATE jobs SET files_done = ?, files_total = ?, series_done = ?, series_total = ?,
+                    current_series = ?, eta_seconds = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (
+                self.files_done, self.files_total, self.series_done, self.series_total,
+                json.dumps(self.current_series), self.eta_seconds(), self.job_id
+            ))
+
+def run_confirm_rename_job(params, progress):
+    """Job behind /confirm-rename with "async": true."""
+    series_id = int(params["series_id"])
+    progress.current_series = [series_id]
+    renamed_files = []
+    summary = {}
+    for kind, record in iter_process_rename(
+        series_id=series_id,
+        chosen_title=params.get("chosen_title"),
+        rename_preview=params.get("rename_preview", {}),
+        **stored_rename_settings(series_id)
+    ):
+        if kind == "plan":
+            progress.files_total = record["files"]
+        elif kind == "file":
+            renamed_files.append(record)
+            progress.files_done += 1
+        else:
+            summary = record
+        progress.save()
+    result = build_rename_result(summary, renamed_files)
+    return "error" not in result, result
+
+def run_autorename_job(params, progress):
+    """Job behind /api/autorename with "async": true."""
+    stored_series = select_stored_series(params.get("series_ids", []), params.get("instance"))
+    if not stored_series:
+        return False, {"error": "No stored information found for the specified series"}
+
+    records = iter_autorename_sweep(
+        stored_series,
+        workers=params.get("workers"),
+        incremental=not params.get("force", False)
+    )
+    success, results = run_sweep_job(stored_series, records, progress)
+    if not success:
+        return False, {"error": "Failed to process any series", "results": results}
+    return True, {"message": "Auto-rename process completed", "results": results}
+
+def run_sweep_job(stored_series, records, progress):
+    """
+    Follow the records of a sweep in a job's progress.
+
+    Returns:
+        tuple: (whether any series succeeded, mapping of series_key -> process_rename result).
+    """
+    progress.series_total = len(stored_series)
+    results = {series_id: None for series_id in stored_series}
+    renamed_files = {series_id: [] for series_id in stored_series}
+    for series_id, kind, record in records:
+        if kind == "plan":
+            progress.files_total += record["files"]
+            progress.current_series.append(series_id)
+        elif kind == "file":
+            renamed_files[series_id].append(record)
+            progress.files_done += 1
+        elif kind == "summary":
+            results[series_id] = build_rename_result(record, renamed_files.pop(series_id))
+            progress.series_done += 1
+            if series_id in progress.current_series:
+                progress.current_series.remove(series_id)
+        progress.save()
+
+    return any(result.get("success", False) for result in results.values()), results
+
+def run_apply_plan_job(params, progress):
+    """Job behind /api/rename-plan/apply with "async": true."""
+    plan = group_plan_rows(params["entries"])
+    stored_series, missing = stored_plan_series(plan)
+    success, results = run_sweep_job(
+        stored_series, iter_apply_plan(stored_series, plan, params.get("workers")), progress
+    )
+    results.update(missing)
+    if not success:
+        return False, {"error": "Failed to process any series", "results": results}
+    return True, {"message": "Rename plan applied", "results": results}
+
+JOB_HANDLERS = {
+    "confirm-rename": run_confirm_rename_job,
+    "autorename": run_autorename_job,
+    "apply-plan": run_apply_plan_job,
+}
+
+# Wakes an idle worker when a job is submitted by this process
+_job_wakeups = queue.Queue()
+_job_workers = []
+_job_workers_lock = threading.Lock()
+
+def submit_job(kind, params):
+    """Queue a background job and return its id right away."""
+    with db_transaction() as conn:
+        job_id = conn.execute(
+            "INSERT INTO jobs (kind, params) VALUES (?, ?)", (kind, json.dumps(params))
+        ).lastrowid
+    start_job_workers()
+    _job_wakeups.put(job_id)
+    logger.info(f"Queued {kind} job {job_id}")
+    return job_id
+
+def claim_next_job():
+    """Mark the oldest queued job as running and return (id, kind, params), or None when there is none."""
+    # BEGIN IMMEDIATE makes the claim atomic, also across processes sharing the database
+    with db_transaction() as conn:
+        row = conn.execute("SELECT id, kind, params FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (row[0],)
+            )
+    if not row:
+        return None
+    return row[0], row[1], json.loads(row[2])
+
+def run_job(job_id, kind, params):
+    """Run a claimed job and store its final status and result."""
+    progress = JobProgress(job_id)
+    try:
+        # Jobs run under the instance of the request that queued them, autorename sweeps every
+        # instance unless one was selected
+        instance = sonarr_instances.get(params.get("instance"))
+        if instance is None:
+            raise ValueError(f"Sonarr instance {params['instance']} is not configured")
+        with use_instance(instance):
+            success, result = JOB_HANDLERS[kind](params, progress)
+        status = "completed" if success else "failed"
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        status, result = "failed", {"error": str(e)}
+
+    progress.current_series = []
+    progress.save(force=True)
+    with db_transaction() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, eta_seconds = NULL, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (status, json.dumps(result), job_id)
+        )
+    logger.info(f"Job {job_id} ({kind}) {status}")
+
+def job_worker():
+    """Worker thread: runs queued jobs one after the other, sleeping while there are none."""
+    while True:
+        try:
+            job = claim_next_job()
+        except Exception as e:
+            logger.error(f"Failed to claim a job: {str(e)}")
+            job = None
+        if job:
+            run_job(*job)
+            continue
+        try:
+            _job_wakeups.get(timeout=JOB_POLL_INTERVAL)
+        except queue.Empty:
+            pass
+
+def start_job_workers():
+    """Start the JOB_WORKERS background worker threads of this process, once."""
+    with _job_workers_lock:
+        while len(_job_workers) < JOB_WORKERS:
+            worker = threading.Thread(target=job_worker, name=f"job-{len(_job_workers)}", daemon=True)
+            worker.start()
+            _job_workers.append(worker)
+
+def recover_jobs():
+    """
+    Mark the jobs left running by a stopped process as "interrupted", then prune finished jobs
+    older than JOB_RETENTION_DAYS. Queued jobs stay queued and run once workers are started.
+
+    Interrupted renames themselves are handled by recover_rename_journal.
+    """
+    with db_transaction() as conn:
+        interrupted = conn.execute(
+            "UPDATE jobs SET status = 'interrupted', finished_at = CURRENT_TIMESTAMP WHERE status = 'running'"
+        ).rowcount
+        conn.execute(
+            "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND created_at < datetime('now', ?)",
+            (f"-{JOB_RETENTION_DAYS} days",)
+        )
+    if interrupted:
+        logger.warning(f"Marked {interrupted} interrupted jobs")
+
+def job_accepted(job_id):
+    """202 response pointing at the status of a queued job."""
+    response = jsonify({"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"})
+    response.headers["Location"] = f"/api/jobs/{job_id}"
+    return response, 202
+
+
+class RescanScheduler:
+    """
+    Collects the series that need a Sonarr rescan and sends one RescanSeries command per series.
+
+    A series is rescanned `window` seconds after it was first scheduled, scheduling it again
+    meanwhile is coalesced into the same rescan. Before sending, Sonarr's command list is
+    checked: a series whose rescan is still queued is skipped, that rescan will see the renames;
+    one whose rescan is already running is retried a window later, as the running scan may
+    have passed the renamed folder already. Commands are sent at most one per `interval` seconds.
+    Series are keyed by (instance name, series_id), each rescan goes to the instance it was
+    scheduled from.
+    """
+
+    def __init__(self, window, interval, history=100):
+        self.window = window
+        self.interval = interval
+        self._pending = {}
+        self._recent = deque(maxlen=history)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._last_sent = 0.0
+
+    def schedule(self, series_id):
+        key = (current_instance().name, series_id)
+        with self._condition:
+            entry = self._pending.get(key)
+            if entry:
+                entry["requests"] += 1
+                metrics.inc("renamerr_rescans_total", "coalesced")
+            else:
+                self._pending[key] = {
+                    "due": time.monotonic() + self.window,
+                    "requests": 1,
+                    "scheduled_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+                }
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rescan-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return "scheduled"
+
+    def flush(self):
+        """Send every pending rescan now, in the calling thread."""
+        with self._condition:
+            due = self._pop_due(everything=True)
+        self._send(due)
+
+    def state(self):
+        """Pending rescans, the outcome of the most recent ones and the settings."""
+        now = time.monotonic()
+        with self._condition:
+            pending = [
+                {
+                    "instance": instance_name,
+                    "series_id": series_id,
+                    "requests": entry["requests"],
+                    "scheduled_at": entry["scheduled_at"],
+                    "due_in_seconds": round(max(0.0, entry["due"] - now), 1),
+                }
+                for (instance_name, series_id), entry in sorted(self._pending.items(), key=lambda item: item[1]["due"])
+            ]
+            recent = list(reversed(self._recent))
+        return {
+            "pending": pending,
+            "recent": recent,
+            "window_seconds": self.window,
+            "interval_seconds": self.interval,
+        }
+
+    def _pop_due(self, everything=False):
+        now = time.monotonic()
+        due = [key for key, entry in self._pending.items() if everything or entry["due"] <= now]
+        return {key: self._pending.pop(key) for key in due}
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._pop_due()
+                while not due:
+                    next_due = min((entry["due"] for entry in self._pending.values()), default=None)
+                    self._condition.wait(None if next_due is None else max(0.0, next_due - time.monotonic()))
+                    due = self._pop_due()
+            try:
+                self._send(due)
+            except Exception as e:
+                logger.error(f"Rescan scheduler failed: {str(e)}")
+
+    def _active_rescans(self):
+        """Map series_id -> status of the RescanSeries commands queued or running in the current instance."""
+        try:
+            response = current_instance().client.get("/command")
+            response.raise_for_status()
+            commands = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Failed to list Sonarr commands, rescanning without deduplication: {str(e)}")
+            return {}
+        active = {}
+        for command in commands:
+            if command.get("name") != "RescanSeries" or command.get("status") not in ("queued", "started"):
+                continue
+            series_id = (command.get("body") or {}).get("seriesId", command.get("seriesId"))
+            if series_id is not None:
+                active[int(series_id)] = command["status"]
+        return active
+
+    def _record(self, key, entry, result):
+        metrics.inc("renamerr_rescans_total", result)
+        self._recent.append({
+            "instance": key[0],
+            "series_id": key[1],
+            "requests": entry["requests"],
+            "result": result,
+            "at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        })
+
+    def _send(self, due):
+        by_instance = {}
+        for key, entry in due.items():
+            by_instance.setdefault(key[0], {})[key] = entry
+        for instance_name, entries in by_instance.items():
+            instance = sonarr_instances.get(instance_name)
+            if instance is None:
+                logger.error(f"Sonarr instance {instance_name} is no longer configured, dropping its rescans")
+                for key, entry in entries.items():
+                    self._record(key, entry, "failed")
+                continue
+            with use_instance(instance):
+                self._send_instance(entries)
+
+    def _send_instance(self, due):
+        active = self._active_rescans()
+        for key, entry in due.items():
+            series_id = key[1]
+            status = active.get(series_id)
+            if status == "queued":
+                logger.info(f"Rescan of series {series_id} already queued in Sonarr, skipping")
+                self._record(key, entry, "deduplicated")
+                continue
+            if status == "started":
+                with self._condition:
+                    pending = self._pending.setdefault(key, dict(entry, requests=0))
+                    pending["requests"] += entry["requests"]
+                    pending["due"] = time.monotonic() + self.window
+                self._record(key, entry, "postponed")
+                continue
+
+            wait = self._last_sent + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            result = send_rescan(series_id)
+            self._last_sent = time.monotonic()
+            self._record(key, entry, "sent" if result == "success" else "failed")
+
+rescan_scheduler = RescanScheduler(RESCAN_DEBOUNCE, RESCAN_INTERVAL)
+
+@app.before_request
+def start_profile():
+    """?profile=1 collects the timings of the request, returned by attach_profile."""
+    if request.args.get("profile") == "1":
+        _profile.set({"started": time.perf_counter(), "spans": [], "dropped": 0})
+        g.profiled = True
+
+@app.after_request
+def attach_profile(response):
+    """
+    Return the profile of a ?profile=1 request: a Server-Timing header summing the time per
+    kind of span, and the full list of spans under "profile" in JSON object responses.
+    Streamed responses only get the header, their body is produced after this runs.
+    """
+    profile = _profile.get()
+    if profile is None or not g.get("profiled"):
+        return response
+    total_ms = round((time.perf_counter() - profile["started"]) * 1000, 3)
+
+    totals = {}
+    for span in profile["spans"]:
+        totals[span["name"]] = totals.get(span["name"], 0) + span["ms"]
+    timings = [f"{name};dur={round(ms, 3)}" for name, ms in totals.items()]
+    response.headers["Server-Timing"] = ", ".join(timings + [f"total;dur={total_ms}"])
+
+    if response.is_json and not response.is_streamed:
+        payload = response.get_json()
+        if isinstance(payload, dict):
+            payload["profile"] = {
+                "total_ms": total_ms,
+                "totals_ms": {name: round(ms, 3) for name, ms in totals.items()},
+                "spans": profile["spans"],
+                "dropped_spans": profile["dropped"],
+            }
+            response.set_data(app.json.dumps(payload))
+    return response
+
+@app.teardown_request
+def stop_profile(exc):
+    # Threads are reused across requests, never let a profile leak into the next one
+    if g.pop("profiled", False):
+        _profile.set(None)
+
+@app.before_request
+def select_instance():
+    """?instance=<name>, or "instance" in a JSON body, selects the Sonarr instance a request works with."""
+    name = request.args.get("instance")
+    if name is None and request.is_json:
+        body = request.get_json(silent=True)
+        name = body.get("instance") if isinstance(body, dict) else None
+    if not name or name == DEFAULT_INSTANCE:
+        return None
+    instance = sonarr_instances.get(name)
+    if instance is None:
+        return jsonify({"error": f"Unknown Sonarr instance {name}"}), 404
+    _instance.set(instance)
+    g.instance_selected = True
+
+@app.teardown_request
+def reset_instance(exc):
+    if g.pop("instance_selected", False):
+        _instance.set(None)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Exposes the metrics of this process in the Prometheus text format."""
+    for instance in sonarr_instances.all():
+        cache_stats = instance.cache.stats()
+        metrics.set("renamerr_cache_requests_total", cache_stats["hits"], instance.name, "hit")
+        metrics.set("renamerr_cache_requests_total", cache_stats["misses"], instance.name, "miss")
+        metrics.set("renamerr_cache_removals_total", cache_stats["evictions"], instance.name, "evicted")
+        metrics.set("renamerr_cache_removals_total", cache_stats["expirations"], instance.name, "expired")
+        metrics.set("renamerr_cache_entries", cache_stats["size"], instance.name)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/')
+def home():
+    return render_template('index.html')
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """
+    Returns request counts and latency for the Sonarr API and the cache statistics of the
+    selected instance, and under "instances" those of every instance.
+    """
+    instance = current_instance()
+    return jsonify({
+        "sonarr": instance.client.stats(),
+        "cache": instance.cache.stats(),
+        "instances": {
+            other.name: {"sonarr": other.client.stats(), "cache": other.cache.stats()}
+            for other in sonarr_instances.all()
+        },
+    })
+
+@app.route('/api/instances', methods=['GET'])
+def list_instances():
+    """Returns the configured Sonarr instances, without their API keys."""
+    return jsonify([instance.describe() for instance in sonarr_instances.all()])
+
+@app.route('/api/instances', methods=['POST'])
+def add_instances():
+    """
+    Adds or updates Sonarr instances.
+
+    Request body, a single object or a list of them:
+    {"name": "anime", "url": "http://sonarr-anime:8989/api/v3", "api_key": "...",
+     "max_connections": 4, "workers": 4, "cache_ttl": 300, "cache_size": 2048}
+    Only name and url are required, the other settings default to the SONARR_* ones.
+    """
+    data = request.json or []
+    if isinstance(data, dict):
+        data = [data]
+    try:
+        rows = [parse_instance_config(config) for config in data]
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    store_sonarr_instances(rows)
+    logger.info(f"Stored {len(rows)} Sonarr instances")
+    return jsonify([sonarr_instances.get(row[0]).describe() for row in rows])
+
+@app.route('/api/instances/<name>', methods=['DELETE'])
+def delete_instance(name):
+    """Removes a Sonarr instance. The information stored for its series is kept."""
+    if name == DEFAULT_INSTANCE:
+        return jsonify({"error": f"'{DEFAULT_INSTANCE}' is configured with SONARR_API_URL and SONARR_API_KEY"}), 400
+    with db_transaction() as conn:
+        deleted = conn.execute("DELETE FROM sonarr_instances WHERE name = ?", (name,)).rowcount
+    if not deleted:
+        return jsonify({"error": f"Unknown Sonarr instance {name}"}), 404
+    sonarr_instances.load()
+    return jsonify({"deleted": name})
+
+@app.route('/api/webhook/sonarr', methods=['POST'])
+def sonarr_webhook():
+    """
+    Receives Sonarr's Webhook connection and drops cached payloads made stale by the event.
+
+    Configure it in Sonarr under Settings > Connect > Webhook with the On Import, On Rename,
+    On Series Add/Delete and On Episode File Delete triggers. For another instance than the
+    default one, add ?instance=<name> to the webhook URL.
+    """
+    payload = request.get_json(silent=True) or {}
+    event_type = payload.get("eventType")
+    series_id = (payload.get("series") or {}).get("id")
+
+    invalidated = 0
+    if event_type in SERIES_INVALIDATING_EVENTS:
+        if series_id is not None:
+            invalidated += invalidate_series_cache(int(series_id))
+        if event_type in ("SeriesAdd", "SeriesDelete") or series_id is None:
+            invalidated += current_instance().cache.invalidate(lambda key: key == ("series",))
+        logger.info(f"Sonarr {event_type} event for series {series_id}, dropped {invalidated} cached payloads")
+
+    return jsonify({"event": event_type, "series_id": series_id, "invalidated": invalidated})
+
+@app.route('/api/rename-batches', methods=['GET'])
+def list_rename_batches():
+    """Returns the most recent rename batches, newest first. ?limit= defaults to 50."""
+    limit = request.args.get("limit", 50, type=int)
+    batch_ids = [row[0] for row in get_db().execute(
+        "SELECT id FROM rename_batches ORDER BY id DESC LIMIT ?", (limit,)
+    )]
+    return jsonify([get_rename_batch(batch_id) for batch_id in batch_ids])
+
+@app.route('/api/rename-batches/<int:batch_id>', methods=['GET'])
+def get_rename_batch_details(batch_id):
+    """Returns a rename batch with every journaled move."""
+    batch = get_rename_batch(batch_id, with_entries=True)
+    if not batch:
+        return jsonify({"error": f"Rename batch {batch_id} not found"}), 404
+    return jsonify(batch)
+
+@app.route('/api/rename-batches/<int:batch_id>/undo', methods=['POST'])
+def undo_rename_batch(batch_id):
+    """Moves every file of a completed or failed rename batch back to its original path."""
+    with journal_lock:
+        batch = get_rename_batch(batch_id)
+        if not batch:
+            return jsonify({"error": f"Rename batch {batch_id} not found"}), 404
+        if batch["status"] not in ("completed", "failed"):
+            return jsonify({
+                "error": f"Rename batch {batch_id} is {batch['status']}, only completed or failed batches can be undone"
+            }), 409
+
+        instance = sonarr_instances.get(batch["instance"])
+        if instance is None:
+            return jsonify({"error": f"Sonarr instance {batch['instance']} of rename batch {batch_id} is not configured"}), 409
+        with use_instance(instance):
+            result = revert_rename_batch(batch_id, batch["series_id"], "undone")
+
+    logger.info(f"Undid rename batch {batch_id}: {result['reverted']} files restored")
+    return jsonify(dict(result, batch_id=batch_id))
+
+@app.route('/api/rescans', methods=['GET'])
+def list_rescans():
+    """Returns the Sonarr rescans waiting in the scheduler and the outcome of the most recent ones."""
+    return jsonify(rescan_scheduler.state())
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Returns the most recent background jobs, newest first. ?limit= defaults to 50, ?status= filters."""
+    limit = request.args.get("limit", 50, type=int)
+    status = request.args.get("status")
+    query = "SELECT id FROM jobs"
+    params = []
+    if status:
+        query += " WHERE status = ?"
+        params.append(status)
+    job_ids = [row[0] for row in get_db().execute(query + " ORDER BY id DESC LIMIT ?", (*params, limit))]
+    jobs = [get_job(job_id) for job_id in job_ids]
+    # The list only carries progress, results can be large
+    for job in jobs:
+        job.pop("result")
+    return jsonify(jobs)
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Returns a background job's progress and ETA, and its result once finished."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/rename-template', methods=['GET', 'POST'])
+def rename_template_info():
+    """
+    Returns the default rename template and the rename backends. POST {"rename_template": ...} to
+    validate a template, optionally rendering it for a sample file.
+    """
+    if request.method == 'GET':
+        return jsonify({
+            "default": DEFAULT_RENAME_TEMPLATE,
+            "tokens": list(TEMPLATE_TOKENS),
+            "backends": list(RENAME_BACKENDS),
+            "default_backend": RENAME_BACKEND
+        })
+
+    data = request.json or {}
+    try:
+        render = compile_template(data.get("rename_template") or DEFAULT_RENAME_TEMPLATE)
+    except TemplateError as e:
+        return jsonify({"valid": False, "error": str(e)}), 400
+
+    sample_file = {
+        "quality": {"quality": {"name": "Bluray-1080p"}},
+        "mediaInfo": {"videoCodec": "x265", "audioCodec": "FLAC", "audioChannels": 2},
+        "releaseGroup": "Group",
+    }
+    return jsonify({"valid": True, "example": render(sample_file, "Series Title", 1, 1, {"title": "Episode Title"}) + ".mkv"})
+
+@app.route('/api/series-info', methods=['GET'])
+def export_series_info():
+    """Returns the stored information of every series."""
+    return jsonify(get_all_stored_series())
+
+@app.route('/api/series-info', methods=['POST'])
+def import_series_info():
+    """
+    Stores the chosen title and folder preferences of many series at once.
 
-def determine_new_path(current_path, new_filename, season, use_season_folders):
-    """Determine the new path based on the current path and folder structure preference."""
-    current_dir = os.path.dirname(current_path)
-    current_in_season = any(f"Season {i:02d}" for i in range(100) if f"Season {i:02d}" in current_path)
-    
-    if use_season_folders:
-        if current_in_season:
-            # If already in season folder, keep it there
-            new_path = os.path.join(current_dir, new_filename)
-        else:
-            # If not in season folder, create season folder structure
-            base_dir = os.path.dirname(current_path)
-            new_path = os.path.join(base_dir, f"Season {int(season):02d}", new_filename)
-    else:
-        if current_in_season:
-            # If currently in season folder but moving to single folder, place in parent directory
-            new_path = os.path.join(os.path.dirname(os.path.dirname(current_path)), new_filename)
-        else:
-            # If already in single folder, keep it there
-            new_path = os.path.join(current_dir, new_filename)
-    
-    return new_path
+    Request body:
+    [
+        {"series_id": 123, "chosen_title": "Title", "use_season_folders": true, "use_absolute_numbering": false,
+         "rename_template": null, "rename_backend": null, "instance": null},
+        ...
+    ]
+    The object returned by GET /api/series-info is accepted as well. Entries without an instance
+    belong to the one selected by ?instance=, the default one otherwise.
+    """
+    data = request.json or []
+    if isinstance(data, dict):
+        data = [dict(info, series_id=series_id) for series_id, info in data.items()]
 
-def rename_file(current_path, new_path, UID, GID):
-    """Rename a file and set permissions."""
-    # Create any necessary directories
-    os.makedirs(os.path.dirname(new_path), exist_ok=True)
-    os.chmod(os.path.dirname(new_path), 0o2775)
-    os.chown(os.path.dirname(new_path), UID, GID)
-    # Rename the file
-    os.rename(current_path, new_path)
-    os.chown(new_path, UID, GID)
-    logger.info(f"File renamed: {current_path} -> {new_path}")
-    return {"status": "renamed", "message": "File renamed successfully."}
+    series_infos = []
+    for item in data:
+        chosen_title = item.get("chosen_title")
+        if item.get("series_id") is None or not chosen_title:
+            return jsonify({"error": "Every entry needs a series_id and a chosen_title"}), 400
+        try:
+            instance, series_id = parse_series_key(item["series_id"])
+        except ValueError:
+            return jsonify({"error": f"Invalid series_id {item['series_id']!r}"}), 400
+        if ":" not in str(item["series_id"]):
+            instance = item.get("instance") or current_instance().name
+        if sonarr_instances.get(instance) is None:
+            return jsonify({"error": f"Unknown Sonarr instance {instance} for series {series_id}"}), 400
+        use_season_folders = bool(item.get("use_season_folders", True))
+        # Single folder layout forces absolute numbering, like the preview does
+        use_absolute_numbering = bool(item.get("use_absolute_numbering", False)) or not use_season_folders
+        rename_template = item.get("rename_template") or None
+        if rename_template:
+            try:
+                compile_template(rename_template)
+            except TemplateError as e:
+                return jsonify({"error": f"Invalid rename template for series {item['series_id']}: {str(e)}"}), 400
+        rename_backend = item.get("rename_backend") or None
+        error = check_rename_backend(rename_backend, chosen_title, use_absolute_numbering, rename_template)
+        if error:
+            return jsonify({"error": f"Invalid rename backend for series {item['series_id']}: {error}"}), 400
+        series_infos.append(
+            (instance, series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend)
+        )
 
-@app.route('/')
-def home():
-    return render_template('index.html')
+    stored = store_series_info_bulk(series_infos)
+    logger.info(f"Stored information for {stored} series")
+    return jsonify({"stored": stored})
 
 @app.route('/series', methods=['GET'])
 def get_series():
-    """Fetches all series from Sonarr."""
-    response = requests.get(f"{SONARR_API_URL}/series", headers=headers)
-    if response.status_code != 200:
+    """
+    Fetches the series from Sonarr as {id, title}, sorted by title.
+
+    ?q= searches the titles and alternate titles, ?mode= is "substring" (default), "prefix" or
+    "fuzzy". ?limit= and ?offset= return one page, the X-Total-Count header holds the number of
+    matches. Responses carry an ETag, an unchanged list is answered 304 to If-None-Match.
+    """
+    query = request.args.get("q", "")
+    mode = request.args.get("mode", "substring")
+    limit = request.args.get("limit", type=int)
+    offset = max(0, request.args.get("offset", 0, type=int))
+    if limit is not None:
+        limit = max(0, limit)
+    if mode not in SERIES_SEARCH_MODES:
+        return jsonify({"error": f"Unknown search mode '{mode}', expected one of {', '.join(SERIES_SEARCH_MODES)}"}), 400
+
+    try:
+        index = get_series_index()
+    except requests.RequestException as e:
+        logger.error(f"Failed to reach Sonarr: {str(e)}")
+        return jsonify({"error": "Failed to reach Sonarr"}), 502
+    except SonarrError as e:
         logger.error("Failed to fetch series from Sonarr")
-        return jsonify({"error": "Failed to fetch series"}), response.status_code
+        return jsonify({"error": "Failed to fetch series"}), e.status_code
 
-    series_list = response.json()
-    return jsonify([
-        {"id": series["id"], "title": series["title"]}
-        for series in series_list
-    ])
+    # The same list and parameters always give the same page, no need to search or serialize again
+    etag = hashlib.sha1(json.dumps([index.version, query, mode, limit, offset]).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        matches = index.search(query, mode)
+        page = matches[offset:offset + limit] if limit is not None else matches[offset:]
+        response = jsonify(page)
+        response.headers["X-Total-Count"] = str(len(matches))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @app.route('/series/<int:series_id>', methods=['GET'])
 def get_alternative_titles(series_id):
     """Fetches alternative titles for a specific series and includes the stored info."""
-    response = requests.get(f"{SONARR_API_URL}/series/{series_id}", headers=headers)
-    if response.status_code != 200:
+    try:
+        series_data = fetch_series(series_id)
+    except requests.RequestException as e:
+        logger.error(f"Failed to reach Sonarr: {str(e)}")
+        return jsonify({"error": "Failed to reach Sonarr"}), 502
+    except SonarrError as e:
         logger.error(f"Failed to fetch series details for series ID {series_id}")
-        return jsonify({"error": "Failed to fetch series details"}), response.status_code
+        return jsonify({"error": "Failed to fetch series details"}), e.status_code
 
-    series_data = response.json()
-    alt_titles = series_data.get("alternateTitles", [])
+    # Copy the list, the cached payload is shared
+    alt_titles = list(series_data.get("alternateTitles", []))
     alt_titles.insert(0, {"title": series_data["title"]})
     
     # Get stored info
@@ -206,110 +2799,310 @@ def get_alternative_titles(series_id):
         
     return jsonify(response_data)
 
-@app.route("/preview-rename", methods=["POST"])
-def preview_rename_files():
-    data = request.json
+def ndjson_record(record):
+    """Serialize one record of a streamed NDJSON response."""
+    return json.dumps(record) + "\n"
+
+def iter_rename_plan(episodes, episode_files, chosen_title, use_season_folders, use_absolute_numbering, file_ids=None, strict=True, rename_template=None):
+    """
+    Plan the rename of every episode file of a series, season by season.
+
+    Args:
+        episodes (list): Sonarr episodes of the series.
+        episode_files (dict): Sonarr episode files of the series, by id.
+        file_ids (set, optional): Only plan these episode files.
+        rename_template (str, optional): The series' rename template, defaults to DEFAULT_RENAME_TEMPLATE.
+        strict (bool, optional): Raise on episodes without a number instead of skipping them.
+
+    Yields:
+        tuple: (season, entry), entry being a preview item with episode, file_id, current, new, status and message.
+        A file holding several episodes is planned once, after its first episode.
+    """
+    # One move per file: multi-episode files would otherwise be moved once per episode
+    first_episodes = {}
+    for episode in episodes:
+        if not episode.get("hasFile"):
+            continue
+        if file_ids is not None and episode["episodeFileId"] not in file_ids:
+            continue
+        first = first_episodes.get(episode["episodeFileId"])
+        if first is None or (episode["seasonNumber"], episode["episodeNumber"] or 0) < (first["seasonNumber"], first["episodeNumber"] or 0):
+            first_episodes[episode["episodeFileId"]] = episode
+
+    # Group episodes by season
+    episodes_by_season = {}
+    for episode in episodes:
+        if first_episodes.get(episode.get("episodeFileId")) is episode:
+            episodes_by_season.setdefault(episode["seasonNumber"], []).append(episode)
+
+    for season, season_episodes in episodes_by_season.items():
+        for episode in season_episodes:
+            episode_file = episode_files.get(episode["episodeFileId"])
+            if not episode_file:
+                continue
+
+            current_path = episode_file["path"]
+            file_extension = os.path.splitext(current_path)[1]
+
+            episode_label = (
+                episode["absoluteEpisodeNumber"] if use_absolute_numbering
+                else episode["episodeNumber"]
+            )
+            if episode_label is None:
+                if strict:
+                    raise ValueError(f"Missing episode number for file: {current_path}")
+                continue
+
+            new_filename = generate_new_filename(
+                episode_file, chosen_title, episode_label, file_extension, rename_template, season, episode
+            )
+            new_path = determine_new_path(current_path, new_filename, season, use_season_folders)
+
+            # Check if the file is already renamed
+            if os.path.basename(current_path) == os.path.basename(new_path):
+                yield season, {
+                    "episode": episode_label,
+                    "file_id": episode_file["id"],
+                    "current": current_path,
+                    "new": new_path,
+                    "status": "already_renamed",
+                    "message": "Already renamed, nothing to do."
+                }
+            else:
+                yield season, {
+                    "episode": episode_label,
+                    "file_id": episode_file["id"],
+                    "current": current_path,
+                    "new": new_path,
+                    "status": "needs_rename",
+                    "message": "File needs to be renamed."
+                }
+
+def start_preview(data):
+    """
+    Parse a preview request, store the series settings and fetch the series from Sonarr.
+
+    Returns:
+        tuple: (plan, None) with an iterator over the iter_rename_plan entries, those to rename
+        verified against the disk by RenameVerifier (local backend, which first goes over the
+        series once for the paths of the files to rename), or (None, error response).
+    """
     series_id = int(data.get("series_id"))
     chosen_title = data.get("chosen_title")
     use_season_folders = data.get("use_season_folders", True)
     use_absolute_numbering = data.get("use_absolute_numbering", False)
+    rename_template = data.get("rename_template") or None
+    rename_backend = data.get("rename_backend") or None
 
     # If using single folder, force absolute numbering
     if not use_season_folders:
         use_absolute_numbering = True
 
-    # Store the series information in the database
-    store_series_info(series_id, chosen_title, use_season_folders, use_absolute_numbering)
+    if rename_template:
+        try:
+            compile_template(rename_template)
+        except TemplateError as e:
+            return None, (jsonify({"error": f"Invalid rename template: {str(e)}"}), 400)
+    series_type = None
+    if (rename_backend or RENAME_BACKEND) == "sonarr":
+        # Sonarr's naming rules depend on the series type
+        try:
+            series_type = fetch_series(series_id).get("seriesType") or "standard"
+        except SonarrError as e:
+            logger.error(f"Failed to fetch series ID {series_id}")
+            return None, (jsonify({"error": "Failed to fetch series"}), e.status_code)
+    error = check_rename_backend(rename_backend, chosen_title, use_absolute_numbering, rename_template, series_type)
+    if error:
+        return None, (jsonify({"error": f"Invalid rename backend: {error}"}), 400)
+
+    # Store the series information in the database, skipping the write when nothing changed
+    stored_info = {
+        "chosen_title": chosen_title,
+        "use_season_folders": bool(use_season_folders),
+        "use_absolute_numbering": bool(use_absolute_numbering),
+        "rename_template": rename_template,
+        "rename_backend": rename_backend
+    }
+    if get_stored_series_info(series_id) != stored_info:
+        store_series_info(series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template, rename_backend)
 
+    # Fetch episode details
     try:
-        # Fetch episode details
-        episode_response = requests.get(
-            f"{SONARR_API_URL}/episode?seriesId={series_id}", headers=headers
-        )
-        if episode_response.status_code != 200:
-            logger.error(f"Failed to fetch episode details for series ID {series_id}")
-            return jsonify({"error": "Failed to fetch episode details"}), episode_response.status_code
+        episodes = fetch_episodes(series_id)
+    except SonarrError as e:
+        logger.error(f"Failed to fetch episode details for series ID {series_id}")
+        return None, (jsonify({"error": "Failed to fetch episode details"}), e.status_code)
 
-        episodes = episode_response.json()
+    # Fetch episode files for the series using seriesId
+    try:
+        episode_file_list = fetch_episode_files(series_id)
+    except SonarrError as e:
+        logger.error(f"Failed to fetch episode files for series ID {series_id}")
+        return None, (jsonify({"error": "Failed to fetch episode files"}), e.status_code)
 
-        # Filter episodes with files
-        episodes_with_files = [ep for ep in episodes if ep.get("hasFile")]
+    episode_files = {file["id"]: file for file in episode_file_list}
 
-        # Fetch episode files for the series using seriesId
-        file_response = requests.get(
-            f"{SONARR_API_URL}/episodefile?seriesId={series_id}", headers=headers
+    def plan_series():
+        return iter_rename_plan(
+            episodes, episode_files, chosen_title, use_season_folders, use_absolute_numbering,
+            rename_template=rename_template
         )
-        if file_response.status_code != 200:
-            logger.error(f"Failed to fetch episode files for series ID {series_id}")
-            return jsonify({"error": "Failed to fetch episode files"}), file_response.status_code
 
-        episode_files = {file["id"]: file for file in file_response.json()}
+    plan = plan_series()
+    if (rename_backend or RENAME_BACKEND) != "sonarr":
+        # Annotate every file to rename with what the disk allows, confirm only renames verified ones.
+        # Only the files being renamed free their names, like when the preview is confirmed: a first
+        # pass keeps just their paths, the entries stream from a second one.
+        verifier = RenameVerifier({entry["current"] for _, entry in plan if entry["status"] == "needs_rename"})
+        plan = (
+            (season, verifier.verify(entry) if entry["status"] == "needs_rename" else entry)
+            for season, entry in plan_series()
+        )
+    return plan, None
 
-        # Group episodes by season
-        episodes_by_season = {}
-        for episode in episodes_with_files:
-            season = episode["seasonNumber"]
-            if season not in episodes_by_season:
-                episodes_by_season[season] = []
-            episodes_by_season[season].append(episode)
+@app.route("/preview-rename", methods=["POST"])
+def preview_rename_files():
+    try:
+        plan, error = start_preview(request.json)
+        if error:
+            return error
 
         # Generate preview for each season
         rename_preview = {}
-        for season, episodes in episodes_by_season.items():
-            preview = []
-            for episode in episodes:
-                episode_file = episode_files.get(episode["episodeFileId"])
-                if not episode_file:
-                    continue
-
-                current_path = episode_file["path"]
-                file_extension = os.path.splitext(current_path)[1]
-                
-                episode_label = (
-                    episode["absoluteEpisodeNumber"] if use_absolute_numbering 
-                    else episode["episodeNumber"]
-                )
-                if episode_label is None:
-                    raise ValueError(f"Missing episode number for file: {current_path}")
+        for season, entry in plan:
+            rename_preview.setdefault(season, []).append(entry)
 
-                new_filename = generate_new_filename(episode_file, chosen_title, episode_label, file_extension)
-                new_path = determine_new_path(current_path, new_filename, season, use_season_folders)
-
-                # Check if the file is already renamed
-                if os.path.basename(current_path) == os.path.basename(new_path):        
-                    preview.append({
-                        "episode": episode_label,
-                        "current": current_path,
-                        "new": new_path,
-                        "status": "already_renamed",
-                        "message": "Already renamed, nothing to do."
-                    })
-                else:
-                    preview.append({
-                        "episode": episode_label,
-                        "current": current_path,
-                        "new": new_path,
-                        "status": "needs_rename",
-                        "message": "File needs to be renamed."
-                    })
+        return jsonify({"rename_preview": rename_preview})
 
-            rename_preview[season] = preview
+    except Exception as e:
+        logger.error(f"Error during preview rename: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"rename_preview": rename_preview})
+@app.route("/preview-rename/stream", methods=["POST"])
+def stream_preview_rename_files():
+    """
+    Streaming variant of /preview-rename, answering with NDJSON.
 
+    Emits one {"type": "episode", "season": ..., <preview item>} record per file as it is planned,
+    then a {"type": "summary"} record with the counts per status and the number of files to
+    rename that failed verification.
+    """
+    try:
+        plan, error = start_preview(request.json)
+        if error:
+            return error
     except Exception as e:
         logger.error(f"Error during preview rename: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+    def generate():
+        counts = {}
+        unverified = 0
+        try:
+            for season, entry in plan:
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+                unverified += entry.get("verified") is False
+                yield ndjson_record(dict(entry, type="episode", season=season))
+            yield ndjson_record(dict(counts, type="summary", total=sum(counts.values()), unverified=unverified))
+        except Exception as e:
+            logger.error(f"Error during preview rename: {str(e)}")
+            yield ndjson_record({"type": "error", "error": str(e)})
+
+    return Response(in_current_instance(generate()), mimetype=NDJSON_MIMETYPE)
+
+def stored_rename_settings(series_id):
+    """Settings a confirmed preview is renamed with, as stored by the preview: the backend and what it needs."""
+    stored_info = get_stored_series_info(series_id) or {}
+    return {
+        "use_season_folders": stored_info.get("use_season_folders", True),
+        "use_absolute_numbering": stored_info.get("use_absolute_numbering", False),
+        "rename_template": stored_info.get("rename_template"),
+        "rename_backend": stored_info.get("rename_backend"),
+    }
+
 @app.route("/confirm-rename", methods=["POST"])
 def confirm_rename_files():
     data = request.json
     rename_preview = data.get("rename_preview", {})
     series_id = int(data.get("series_id"))  # Make sure series_id is included in the request
 
-    result = process_rename(rename_preview=rename_preview)
+    # "async": true queues the renames and answers right away with a job id
+    if data.get("async"):
+        return job_accepted(submit_job("confirm-rename", {
+            "instance": current_instance().name,
+            "series_id": series_id,
+            "chosen_title": data.get("chosen_title"),
+            "rename_preview": rename_preview
+        }))
+
+    result = process_rename(
+        series_id=series_id,
+        chosen_title=data.get("chosen_title"),
+        rename_preview=rename_preview,
+        **stored_rename_settings(series_id)
+    )
     return jsonify(result)
 
+@app.route("/confirm-rename/stream", methods=["POST"])
+def stream_confirm_rename_files():
+    """
+    Streaming variant of /confirm-rename, answering with NDJSON.
+
+    Emits a {"type": "plan", "files": n} record, one {"type": "file"} record per file as it is
+    renamed or skipped, then the {"type": "summary"} record holding what /confirm-rename returns
+    besides renamed_files. Once started, the renames complete even if the client disconnects.
+    """
+    data = request.json
+    series_id = int(data.get("series_id"))
+    settings = stored_rename_settings(series_id)
+
+    def rename_series(key, series_id, info):
+        return iter_process_rename(
+            series_id=series_id,
+            chosen_title=data.get("chosen_title"),
+            rename_preview=data.get("rename_preview", {}),
+            **settings
+        )
+
+    # The renames run on a worker thread: a client going away stops the records, never the batch
+    instance_name = current_instance().name
+    records = iter_series_sweep(
+        {series_key(instance_name, series_id): {"instance": instance_name}}, rename_series, workers=1
+    )
+
+    def generate():
+        for _, kind, record in records:
+            yield ndjson_record(dict(record, type=kind))
+
+    return Response(in_current_instance(generate()), mimetype=NDJSON_MIMETYPE)
+
+def select_stored_series(specific_series_ids=None, instance=None):
+    """
+    Return the stored series information, restricted to the series of one instance and to
+    specific_series_ids when given. Bare ids among specific_series_ids are series of that
+    instance, of the default one without it; "name:id" keys name their instance.
+    """
+    stored_series = get_all_stored_series()
+    if instance:
+        stored_series = {key: info for key, info in stored_series.items() if info["instance"] == instance}
+    if specific_series_ids:
+        wanted = set()
+        for key in specific_series_ids:
+            try:
+                wanted.add(normalize_series_key(key, instance))
+            except ValueError:
+                continue
+        stored_series = {
+            key: info
+            for key, info in stored_series.items()
+            if key in wanted
+        }
+    return stored_series
+
+def selected_instance_name():
+    """Name of the instance the request selected with ?instance= or "instance", None when it did not select one."""
+    return current_instance().name if g.get("instance_selected") else None
+
 @app.route("/api/autorename", methods=["POST"])
 def auto_rename():
     """
@@ -317,39 +3110,39 @@ def auto_rename():
     
     Request body (optional):
     {
-        "series_ids": ["123", "456"]  # Optional list of series IDs to process
+        "series_ids": ["123", "456"],  # Optional list of series IDs to process, "name:123" for other instances
+        "instance": "anime",           # Optional, only the series of this Sonarr instance
+        "workers": 8,                  # Optional number of series processed in parallel per instance
+        "force": true,                 # Optional, re-evaluate files unchanged since the last run
+        "async": true                  # Optional, answer 202 with a job id and run in the background
     }
     """
     try:
         data = request.json or {}
-        specific_series_ids = data.get("series_ids", [])
-        
+
         # Get stored series information from database
-        stored_series = get_all_stored_series()
-        
-        # If specific series IDs provided, filter stored_series
-        if specific_series_ids:
-            stored_series = {
-                series_id: info 
-                for series_id, info in stored_series.items() 
-                if series_id in specific_series_ids
-            }
-        
+        stored_series = select_stored_series(data.get("series_ids", []), selected_instance_name())
+
         if not stored_series:
             logger.error("No stored information found for the specified series")
             return jsonify({
                 "error": "No stored information found for the specified series"
             }), 404
 
-        # Process each series
-        results = {}
-        for series_id, info in stored_series.items():
-            results[series_id] = process_rename(
-                series_id=int(series_id),
-                chosen_title=info["chosen_title"],
-                use_season_folders=info["use_season_folders"],
-                use_absolute_numbering=info.get("use_absolute_numbering", False)
-            )
+        if data.get("async"):
+            return job_accepted(submit_job("autorename", {
+                "instance": selected_instance_name(),
+                "series_ids": data.get("series_ids", []),
+                "workers": data.get("workers"),
+                "force": data.get("force", False)
+            }))
+
+        # Process the series concurrently, keeping the results in request order
+        results = run_autorename_sweep(
+            stored_series,
+            workers=data.get("workers"),
+            incremental=not data.get("force", False)
+        )
 
         # Check if any series was processed successfully
         any_success = any(
@@ -375,7 +3168,429 @@ def auto_rename():
             "error": f"Error during auto-rename: {str(e)}"
         }), 500
 
-def process_rename(series_id=None, chosen_title=None, use_season_folders=True, use_absolute_numbering=False, rename_preview=None):
+@app.route("/api/autorename/stream", methods=["POST"])
+def stream_auto_rename():
+    """
+    Streaming variant of /api/autorename, answering with NDJSON. Takes the same request body.
+
+    Emits a {"type": "plan", "series_id": ..., "files": n} record when a series starts renaming,
+    {"type": "file", "series_id": ...} records as files are renamed, a {"type": "series"}
+    record holding each series' result once it completes, and a final {"type": "summary"} record.
+    Series run in parallel, so records of different series interleave.
+    """
+    data = request.json or {}
+    stored_series = select_stored_series(data.get("series_ids", []), selected_instance_name())
+    if not stored_series:
+        logger.error("No stored information found for the specified series")
+        return jsonify({
+            "error": "No stored information found for the specified series"
+        }), 404
+
+    records = iter_autorename_sweep(
+        stored_series,
+        workers=data.get("workers"),
+        incremental=not data.get("force", False)
+    )
+
+    def generate():
+        processed = succeeded = 0
+        for series_id, kind, record in records:
+            if kind == "summary":
+                processed += 1
+                succeeded += int(record.get("success", False))
+                kind = "series"
+            yield ndjson_record(dict(record, type=kind, series_id=series_id))
+        yield ndjson_record({
+            "type": "summary",
+            "processed": processed,
+            "succeeded": succeeded,
+            "message": "Auto-rename process completed"
+        })
+
+    return Response(in_current_instance(generate()), mimetype=NDJSON_MIMETYPE)
+
+@app.route("/api/rename-plan", methods=["GET"])
+def export_rename_plan():
+    """
+    Streams the planned renames of every series with stored info, from the cached Sonarr data,
+    without renaming anything or writing to the database. One row per episode file: series_id,
+    file_id, episode, old and new path, and status ("needs_rename" or "already_renamed").
+
+    ?format=csv answers CSV with a header line instead of NDJSON. ?status= keeps the rows of one
+    status, ?series_ids=1,anime:2 and ?instance= restrict the series and ?workers= sets the number
+    of series planned in parallel per instance. A series that cannot be planned gets one row with
+    status "error" and the error. Rows of different series interleave.
+    """
+    output = request.args.get("format", "ndjson")
+    if output not in ("ndjson", "csv"):
+        return jsonify({"error": f"Unknown format {output}, expected ndjson or csv"}), 400
+    series_ids = [key for key in request.args.get("series_ids", "").split(",") if key]
+    stored_series = select_stored_series(series_ids, selected_instance_name())
+    status = request.args.get("status")
+    workers = request.args.get("workers", type=int)
+
+    def generate():
+        if output == "csv":
+            yield csv_record(dict(zip(PLAN_COLUMNS, PLAN_COLUMNS)))
+        for row in iter_library_plan(stored_series, workers):
+            if status and row["status"] not in (status, "error"):
+                continue
+            yield csv_record(row) if output == "csv" else ndjson_record(row)
+
+    if output == "csv":
+        response = Response(in_current_instance(generate()), mimetype="text/csv")
+        response.headers["Content-Disposition"] = "attachment; filename=rename-plan.csv"
+        return response
+    return Response(in_current_instance(generate()), mimetype=NDJSON_MIMETYPE)
+
+@app.route("/api/rename-plan/apply", methods=["POST"])
+def apply_rename_plan():
+    """
+    Renames the files of an exported rename plan, or of any subset of its rows.
+
+    Takes the CSV or NDJSON of GET /api/rename-plan as the body, with Content-Type text/csv or
+    application/x-ndjson, or JSON: a list of rows or {"entries": [...], "workers": 8, "async": true}.
+    With a CSV or NDJSON body, ?workers= and ?async=1 set the same options. Only the
+    "needs_rename" rows still matching the current plan are renamed, see iter_apply_plan. Series
+    run in parallel like /api/autorename, whose answer this one mirrors.
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    options = data if isinstance(data, dict) else request.args
+    try:
+        workers = int(options["workers"]) if options.get("workers") else None
+        plan = group_plan_rows(read_plan_rows(), selected_instance_name())
+    except (ValueError, AttributeError, csv.Error) as e:
+        return jsonify({"error": f"Invalid rename plan: {str(e)}"}), 400
+    if not plan:
+        return jsonify({"error": "The rename plan has no files to rename"}), 400
+
+    if options.get("async") in (True, "1", "true"):
+        return job_accepted(submit_job("apply-plan", {
+            "entries": [dict(row, series_id=key) for key, rows in plan.items() for row in rows.values()],
+            "workers": workers
+        }))
+
+    stored_series, results = stored_plan_series(plan)
+    results.update(collect_rename_results(stored_series, iter_apply_plan(stored_series, plan, workers)))
+
+    if not any(result.get("success", False) for result in results.values()):
+        logger.error("Failed to apply the rename plan to any series")
+        return jsonify({
+            "error": "Failed to process any series",
+            "results": results
+        }), 500
+    return jsonify({
+        "message": "Rename plan applied",
+        "results": results
+    })
+
+def iter_series_sweep(stored_series, handler, workers=None):
+    """
+    Run handler for every stored series, on one bounded thread pool per Sonarr instance so the
+    instances are swept in parallel, each within its own limits.
+
+    Records are handed over through a bounded queue, so a slow consumer throttles the
+    workers instead of letting results pile up in memory. Closing the generator early
+    skips the series not started yet; the ones in progress still run to completion,
+    so they are not left half renamed without a rescan.
+
+    Args:
+        stored_series (dict): Mapping of series_key -> stored info, as returned by get_all_stored_series.
+        handler (callable): handler(series_key, series_id, info), run under the series' instance,
+            returning an iterable of (kind, record). An exception ends the series with a
+            ("summary", {"error": ...}) record.
+        workers (int, optional): Number of worker threads per instance, defaults to the instance's workers.
+
+    Yields:
+        tuple: (series_key, kind, record), in completion order.
+    """
+    by_instance = {}
+    for key, info in stored_series.items():
+        instance_name, series_id = parse_series_key(key)
+        by_instance.setdefault(info.get("instance", instance_name), []).append((key, series_id, info))
+
+    pools = []
+    for instance_name, series in by_instance.items():
+        instance = sonarr_instances.get(instance_name)
+        pool_workers = max(1, min(int(workers or (instance.workers if instance else 1)), len(series)))
+        pools.append((instance, instance_name, series, pool_workers))
+    records = queue.Queue(maxsize=sum(pool[3] for pool in pools) * 64)
+    cancelled = threading.Event()
+    finished = object()
+
+    def put(item):
+        # Once the consumer is gone, records are dropped instead of queued
+        while not cancelled.is_set():
+            try:
+                records.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def process_series(instance, key, series_id, info):
+        if cancelled.is_set():
+            return
+        try:
+            with use_instance(instance):
+                for kind, record in handler(key, series_id, info):
+                    put((key, kind, record))
+        except Exception as e:
+            logger.error(f"Error while processing series {key}: {str(e)}")
+            put((key, "summary", {"error": str(e)}))
+        finally:
+            put(finished)
+
+    executors = []
+    try:
+        remaining = len(stored_series)
+        for instance, instance_name, series, pool_workers in pools:
+            if instance is None:
+                for key, _, _ in series:
+                    yield key, "summary", {"error": f"Sonarr instance {instance_name} is not configured"}
+                    remaining -= 1
+                continue
+            executor = ThreadPoolExecutor(max_workers=pool_workers, thread_name_prefix=f"sweep-{instance_name}")
+            executors.append(executor)
+            for key, series_id, info in series:
+                # Carry the request's profile, if any, over to the worker threads
+                executor.submit(copy_context().run, process_series, instance, key, series_id, info)
+        while remaining:
+            item = records.get()
+            if item is finished:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        cancelled.set()
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def iter_autorename_sweep(stored_series, workers=None, incremental=True):
+    """
+    Run iter_process_rename for every stored series with iter_series_sweep.
+
+    Args:
+        stored_series (dict): Mapping of series_key -> stored info, as returned by get_all_stored_series.
+        workers (int, optional): Number of worker threads per instance, defaults to the instance's workers.
+        incremental (bool, optional): Only look at episode files changed since the last run.
+
+    Yields:
+        tuple: (series_key, kind, record) as produced by iter_process_rename, in completion order.
+    """
+    def rename_series(key, series_id, info):
+        return iter_process_rename(
+            series_id=series_id,
+            chosen_title=info["chosen_title"],
+            use_season_folders=info["use_season_folders"],
+            use_absolute_numbering=info.get("use_absolute_numbering", False),
+            incremental=incremental,
+            rename_template=info.get("rename_template"),
+            rename_backend=info.get("rename_backend")
+        )
+
+    return iter_series_sweep(stored_series, rename_series, workers)
+
+def run_autorename_sweep(stored_series, workers=None, incremental=True):
+    """
+    Run process_rename for every stored series on a bounded thread pool.
+
+    Args:
+        stored_series (dict): Mapping of series_key -> stored info, as returned by get_all_stored_series.
+        workers (int, optional): Number of worker threads per instance, defaults to the instance's workers.
+        incremental (bool, optional): Only look at episode files changed since the last run.
+
+    Returns:
+        dict: Mapping of series_key -> process_rename result, in the same order as stored_series.
+    """
+    return collect_rename_results(stored_series, iter_autorename_sweep(stored_series, workers, incremental))
+
+def collect_rename_results(stored_series, records):
+    """Gather the (series_key, kind, record) records of a sweep into one process_rename result per series."""
+    results = {key: None for key in stored_series}
+    renamed_files = {key: [] for key in stored_series}
+    for key, kind, record in records:
+        if kind == "file":
+            renamed_files[key].append(record)
+        elif kind == "summary":
+            results[key] = build_rename_result(record, renamed_files.pop(key))
+    return results
+
+# Columns of a rename plan row, in CSV order; "error" is only set on the rows of series that could not be planned
+PLAN_COLUMNS = ("series_id", "file_id", "episode", "old", "new", "status", "error")
+
+def iter_series_plan(series_id, info, file_ids=None):
+    """
+    Plan the renames of a stored series from the cached Sonarr data, without touching the
+    database or the disk.
+
+    Args:
+        info (dict): Stored info of the series, as returned by get_all_stored_series.
+        file_ids (set, optional): Only plan these episode files.
+
+    Yields:
+        dict: The iter_rename_plan entries of the series, one per episode file.
+    """
+    episodes = fetch_episodes(series_id)
+    episode_files = {file["id"]: file for file in fetch_episode_files(series_id)}
+    for season, entry in iter_rename_plan(
+        episodes, episode_files, info["chosen_title"], info["use_season_folders"],
+        info.get("use_absolute_numbering", False), file_ids=file_ids, strict=False,
+        rename_template=info.get("rename_template")
+    ):
+        yield entry
+
+def iter_library_plan(stored_series, workers=None):
+    """
+    Plan every stored series in parallel with iter_series_sweep.
+
+    Yields:
+        dict: One row per episode file with the PLAN_COLUMNS, series_id being the series_key,
+        and a {"series_id", "status": "error", "error"} row per series that could not be planned.
+    """
+    def plan_series(key, series_id, info):
+        # One record per series rather than per file keeps the hand-over between threads cheap
+        yield "entries", list(iter_series_plan(series_id, info))
+
+    for key, kind, record in iter_series_sweep(stored_series, plan_series, workers):
+        if kind == "entries":
+            for entry in record:
+                yield {
+                    "series_id": key,
+                    "file_id": entry["file_id"],
+                    "episode": entry["episode"],
+                    "old": entry["current"],
+                    "new": entry["new"],
+                    "status": entry["status"],
+                }
+        elif "error" in record:
+            yield {"series_id": key, "status": "error", "error": record["error"]}
+
+def csv_record(row):
+    """Encode a rename plan row as a CSV line."""
+    line = io.StringIO()
+    csv.writer(line).writerow([row.get(column, "") for column in PLAN_COLUMNS])
+    return line.getvalue()
+
+def read_plan_rows():
+    """
+    Read the rename plan rows of a request body: CSV or NDJSON, as exported by GET
+    /api/rename-plan, or JSON, either a list of rows or {"entries": [...]}. The text bodies
+    are parsed as they are read.
+
+    Returns:
+        iterable: The rows, as dicts.
+    """
+    if request.mimetype == "text/csv":
+        return csv.DictReader(io.TextIOWrapper(request.stream, encoding="utf-8", newline=""))
+    if request.mimetype == NDJSON_MIMETYPE:
+        lines = io.TextIOWrapper(request.stream, encoding="utf-8")
+        return (json.loads(line) for line in lines if line.strip())
+    data = request.get_json(silent=True) or []
+    return data.get("entries", []) if isinstance(data, dict) else data
+
+def group_plan_rows(rows, instance=None):
+    """
+    Group rename plan rows by series, keeping the ones to rename.
+
+    Returns:
+        dict: Mapping of series_key -> {file_id: row}, bare series ids being series of
+        `instance`. Rows with another status than "needs_rename" are left out.
+
+    Raises:
+        ValueError: When a row lacks a column or holds an invalid id.
+    """
+    plan = {}
+    for number, row in enumerate(rows, 1):
+        if (row.get("status") or "needs_rename") != "needs_rename":
+            continue
+        if any(row.get(column) in (None, "") for column in ("series_id", "file_id", "old", "new")):
+            raise ValueError(f"Row {number} needs a series_id, file_id, old and new")
+        key = normalize_series_key(row["series_id"], instance)
+        file_id = int(row["file_id"])
+        plan.setdefault(key, {})[file_id] = {
+            "file_id": file_id,
+            "episode": row.get("episode") or file_id,
+            "old": row["old"],
+            "new": row["new"],
+        }
+    return plan
+
+def stored_plan_series(plan):
+    """
+    Stored info of the series of a rename plan.
+
+    Returns:
+        tuple: (mapping of series_key -> stored info, mapping of series_key -> error result for
+        the series without stored info).
+    """
+    all_series = get_all_stored_series()
+    stored_series = {key: all_series[key] for key in plan if key in all_series}
+    missing = {key: {"error": f"No stored information found for series {key}"} for key in plan if key not in all_series}
+    return stored_series, missing
+
+def iter_apply_plan(stored_series, plan, workers=None):
+    """
+    Carry out the rows of an exported rename plan with iter_series_sweep, each series through
+    iter_process_rename with its stored backend.
+
+    The series are planned again first: only rows still matching the current plan, same file,
+    same old and new path, are renamed. The others are reported as "stale" and skipped, so an
+    outdated export never moves files the series' settings would not.
+
+    Args:
+        stored_series (dict): Mapping of series_key -> stored info, for the series in plan.
+        plan (dict): Mapping of series_key -> {file_id: row}, as returned by group_plan_rows.
+
+    Yields:
+        tuple: (series_key, kind, record) as produced by iter_process_rename.
+    """
+    def apply_series(key, series_id, info):
+        rows = dict(plan[key])
+        preview = []
+        stale = []
+        for entry in iter_series_plan(series_id, info, file_ids=set(rows)):
+            row = rows.pop(entry["file_id"], None)
+            if row is None:
+                # The row of this file was looked at already
+                continue
+            if entry["current"] == row["old"] and entry["new"] == row["new"]:
+                preview.append(entry)
+            else:
+                stale.append(row)
+        # Files Sonarr no longer has
+        stale.extend(rows.values())
+
+        for row in stale:
+            yield "file", {
+                "message": f"Episode {row['episode']} skipped, the plan changed since it was exported.",
+                "path": row["old"],
+                "status": "stale"
+            }
+        for kind, record in iter_process_rename(
+            series_id=series_id,
+            chosen_title=info["chosen_title"],
+            use_season_folders=info["use_season_folders"],
+            use_absolute_numbering=info.get("use_absolute_numbering", False),
+            rename_preview={"plan": preview},
+            rename_template=info.get("rename_template"),
+            rename_backend=info.get("rename_backend")
+        ):
+            if kind == "summary" and "error" not in record:
+                message = record["message"]
+                if stale:
+                    message += f" {len(stale)} files changed since the plan was exported and were skipped."
+                record = dict(record, stale=len(stale), message=message)
+            yield kind, record
+
+    return iter_series_sweep(stored_series, apply_series, workers)
+
+def build_rename_result(summary, renamed_files):
+    """Combine the summary record of iter_process_rename with its file records."""
+    if "error" in summary:
+        return summary
+    return dict(summary, renamed_files=renamed_files)
+
+def process_rename(series_id=None, chosen_title=None, use_season_folders=True, use_absolute_numbering=False, rename_preview=None, incremental=False, rename_template=None, rename_backend=None):
     """
     Process rename for a single series or based on a rename preview.
     
@@ -384,137 +3599,314 @@ def process_rename(series_id=None, chosen_title=None, use_season_folders=True, u
         chosen_title (str, optional): The title to use for renaming (for API calls).
         use_season_folders (bool, optional): Whether to use season folders (for API calls).
         rename_preview (dict, optional): The rename preview object (for frontend calls).
+        incremental (bool, optional): Skip episode files unchanged since the series' last watermark (for API calls).
+        rename_template (str, optional): The series' rename template.
+        rename_backend (str, optional): "local" or "sonarr", defaults to RENAME_BACKEND.
+    """
+    renamed_files = []
+    summary = {}
+    for kind, record in iter_process_rename(
+        series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_preview, incremental, rename_template,
+        rename_backend
+    ):
+        if kind == "file":
+            renamed_files.append(record)
+        elif kind == "summary":
+            summary = record
+    return build_rename_result(summary, renamed_files)
+
+def iter_process_rename(series_id=None, chosen_title=None, use_season_folders=True, use_absolute_numbering=False, rename_preview=None, incremental=False, rename_template=None, rename_backend=None):
+    """
+    Generator behind process_rename, taking the same arguments.
+
+    Yields:
+        tuple: ("plan", {"files": n}) once the files to look at are known, ("file", record) for
+        every file as soon as it is renamed or skipped, then one ("summary", result) holding the
+        counts, rescan status and message, or an "error".
     """
     UID = int(os.getenv("PUID", 1000))
     GID = int(os.getenv("PGID", 100))
 
+    batch = None
+    to_rename = []
     try:
-        renamed_files = []
         logs = []
+        num_renamed = 0
+        num_skipped = 0
+        num_failed = 0
+        num_unverified = 0
+        skipped_unchanged = 0
+        backend = rename_backend or RENAME_BACKEND
 
         if rename_preview:
             # Process based on rename_preview (frontend call)
-            for season, episodes in rename_preview.items():
-                for item in episodes:
-                    current_path = item["current"]
-                    new_path = item["new"]
-                    
-                    # Skip if the file is already renamed
-                    if item.get("status") == "already_renamed":
-                        logs.append(f"File already renamed: {current_path}")
-                        renamed_files.append({
-                            "message": f"Episode {item['episode']} already renamed, nothing to do.",
-                            "path": current_path,
-                            "status": "already_renamed"
-                        })
-                    else:
-                        # Rename the file
-                        rename_result = rename_file(current_path, new_path, UID, GID)
-                        logs.append(rename_result["message"])
-                        renamed_files.append({
-                            "message": f"Episode {item['episode']} file renamed successfully.",
-                            "new": new_path,
-                            "old": current_path,
-                            "status": "renamed"
-                        })
+            planned = [item for episodes in rename_preview.values() for item in episodes]
         else:
             # Process based on series_id (API call)
             if not series_id or not chosen_title:
-                return {"error": "Missing series_id or chosen_title"}
-
-            # Fetch episode details
-            episode_response = requests.get(
-                f"{SONARR_API_URL}/episode?seriesId={series_id}", 
-                headers=headers
-            )
-            if episode_response.status_code != 200:
-                logger.error(f"Failed to fetch episodes for series {series_id}")
-                return {"error": f"Failed to fetch episodes for series {series_id}"}
-
-            episodes = episode_response.json()
-            episodes_with_files = [ep for ep in episodes if ep.get("hasFile")]
+                yield "summary", {"error": "Missing series_id or chosen_title"}
+                return
 
             # Fetch episode files
-            file_response = requests.get(
-                f"{SONARR_API_URL}/episodefile?seriesId={series_id}", 
-                headers=headers
-            )
-            if file_response.status_code != 200:
+            fetch_started = time.perf_counter()
+            try:
+                episode_file_list = fetch_episode_files(series_id)
+            except SonarrError:
                 logger.error(f"Failed to fetch episode files for series {series_id}")
-                return {"error": f"Failed to fetch episode files for series {series_id}"}
+                yield "summary", {"error": f"Failed to fetch episode files for series {series_id}"}
+                return
 
-            episode_files = {file["id"]: file for file in file_response.json()}
+            episode_files = {file["id"]: file for file in episode_file_list}
 
-            # Process each episode
-            for episode in episodes_with_files:
-                episode_file = episode_files.get(episode["episodeFileId"])
-                if not episode_file:
-                    continue
+            settings_hash = hash_settings(chosen_title, use_season_folders, use_absolute_numbering, rename_template)
+            file_stamps = {str(file_id): episode_file_stamp(file) for file_id, file in episode_files.items()}
+            files_hash = hash_file_stamps(settings_hash, file_stamps)
+
+            # Only look at files added or moved since the last run, unless the settings changed
+            changed_file_ids = None
+            if incremental:
+                watermark = get_series_watermark(series_id)
+                if watermark and watermark["files_hash"] == files_hash:
+                    logger.info(f"Series {series_id} unchanged since the last run, skipping")
+                    observe_timing(RENAME_PHASE_METRIC, time.perf_counter() - fetch_started, "fetch")
+                    yield "summary", {
+                        "id": series_id,
+                        "title": chosen_title,
+                        "rescan_status": "not_triggered",
+                        "success": True,
+                        "logs": logs,
+                        "skipped_unchanged": len(file_stamps),
+                        "message": "No changes since the last run, nothing to do."
+                    }
+                    return
+                if watermark and watermark["settings_hash"] == settings_hash:
+                    changed_file_ids = {
+                        int(file_id) for file_id, stamp in file_stamps.items()
+                        if watermark["file_stamps"].get(file_id) != stamp
+                    }
+                    skipped_unchanged = len(file_stamps) - len(changed_file_ids)
 
-                current_path = episode_file["path"]
-                file_extension = os.path.splitext(current_path)[1]
-                
-                episode_label = (
-                    episode["absoluteEpisodeNumber"] if use_absolute_numbering 
-                    else episode["episodeNumber"]
+            # Fetch episode details, unless no file needs to be looked at
+            if changed_file_ids is None or changed_file_ids:
+                try:
+                    episodes = fetch_episodes(series_id)
+                except SonarrError:
+                    logger.error(f"Failed to fetch episodes for series {series_id}")
+                    yield "summary", {"error": f"Failed to fetch episodes for series {series_id}"}
+                    return
+            else:
+                episodes = []
+            observe_timing(RENAME_PHASE_METRIC, time.perf_counter() - fetch_started, "fetch")
+
+        plan_started = time.perf_counter()
+        if not rename_preview:
+            planned = [
+                entry for season, entry in iter_rename_plan(
+                    episodes, episode_files, chosen_title, use_season_folders, use_absolute_numbering,
+                    file_ids=changed_file_ids, strict=False, rename_template=rename_template
                 )
-                
-                if episode_label is None:
-                    continue
+            ]
+
+        # Plan the whole batch first: conflicts fail here, before anything touches the disk
+        to_rename = [item for item in planned if item.get("status") != "already_renamed"]
+        unverified = []
+        if backend != "sonarr":
+            # Check every move against the disk in one pass, only the verified ones are carried out.
+            # Sonarr checks the files itself, and they may not even be mounted here.
+            verifier = RenameVerifier({item["current"] for item in to_rename})
+            for item in to_rename:
+                verifier.verify(item)
+            unverified = [item for item in to_rename if not item["verified"]]
+            to_rename = [item for item in to_rename if item["verified"]]
+        rename_plan = plan_rename_batch([(item["current"], item["new"]) for item in to_rename])
+        operations = rename_plan["operations"]
+        observe_timing(RENAME_PHASE_METRIC, time.perf_counter() - plan_started, "plan")
+        yield "plan", {"files": len(planned)}
+
+        for item in unverified:
+            num_skipped += 1
+            metrics.inc("renamerr_files_total", "skipped")
+            if item["verification"] == "already_moved":
+                yield "file", {
+                    "message": f"Episode {item['episode']} already renamed, waiting for Sonarr to rescan.",
+                    "path": item["new"],
+                    "status": "already_renamed"
+                }
+                continue
+            num_unverified += 1
+            if not rename_preview:
+                # Look at the file again on the next run, even if Sonarr reports no change
+                file_stamps.pop(str(item["file_id"]), None)
+            message = f"Episode {item['episode']} skipped, {VERIFICATION_MESSAGES[item['verification']]}."
+            logs.append(f"{message} {item['current']} -> {item['new']}")
+            yield "file", {
+                "message": message,
+                "path": item["current"],
+                "status": "skipped",
+                "verification": item["verification"]
+            }
+
+        for index in rename_plan["already_moved"]:
+            item = to_rename[index]
+            num_skipped += 1
+            metrics.inc("renamerr_files_total", "skipped")
+            yield "file", {
+                "message": f"Episode {item['episode']} already renamed, waiting for Sonarr to rescan.",
+                "path": item["new"],
+                "status": "already_renamed"
+            }
+
+        for item in planned:
+            # Skip if the file is already renamed
+            if item.get("status") == "already_renamed":
+                if rename_preview:
+                    logs.append(f"File already renamed: {item['current']}")
+                num_skipped += 1
+                metrics.inc("renamerr_files_total", "skipped")
+                yield "file", {
+                    "message": f"Episode {item['episode']} already renamed, nothing to do.",
+                    "path": item["current"],
+                    "status": "already_renamed"
+                }
 
-                new_filename = generate_new_filename(episode_file, chosen_title, episode_label, file_extension)
-                new_path = determine_new_path(current_path, new_filename, episode["seasonNumber"], use_season_folders)
+        if backend == "sonarr":
+            # Sonarr moves the files and updates its database itself: no journal, no rescan
+            already_moved = set(rename_plan["already_moved"])
+            items = [item for index, item in enumerate(to_rename) if index not in already_moved]
+            with timed(RENAME_PHASE_METRIC, "execute"):
+                renamed_files = rename_with_sonarr(
+                    series_id, chosen_title, use_season_folders, use_absolute_numbering, rename_template,
+                    [item["file_id"] for item in items]
+                ) if items else {}
 
-                # Check if the file is already renamed
-                if os.path.basename(current_path) == os.path.basename(new_path):
-                    renamed_files.append({
-                        "message": f"Episode {episode_label} already renamed, nothing to do.",
-                        "path": current_path,
-                        "status": "already_renamed"
-                    })
+            for item in items:
+                renamed_file = renamed_files.get(item["file_id"])
+                if renamed_file is None or renamed_file["path"] == item["current"]:
+                    num_failed += 1
+                    metrics.inc("renamerr_files_total", "failed")
+                    if not rename_preview:
+                        # Look at the file again on the next run, even if Sonarr reports no change
+                        file_stamps.pop(str(item["file_id"]), None)
+                    yield "file", {
+                        "message": f"Episode {item['episode']} was not renamed by Sonarr.",
+                        "path": item["current"],
+                        "status": "failed"
+                    }
+                    continue
+                metrics.inc("renamerr_files_total", "renamed")
+                if rename_preview:
+                    logs.append(f"Renamed by Sonarr: {item['current']} -> {renamed_file['path']}")
                 else:
-                    # Rename the file
-                    rename_result = rename_file(current_path, new_path, UID, GID)
-                    if rename_result["status"] == "renamed":
-                        renamed_files.append({
-                            "message": f"Episode {episode_label} file renamed successfully.",
-                            "new": new_path,
-                            "old": current_path,
-                            "status": "renamed"
-                        })
+                    file_stamps[str(item["file_id"])] = episode_file_stamp(renamed_file)
+                num_renamed += 1
+                yield "file", {
+                    "message": f"Episode {item['episode']} file renamed successfully.",
+                    "new": renamed_file["path"],
+                    "old": item["current"],
+                    "status": "renamed"
+                }
+        else:
+            # Journal every move before touching the disk. The execute phase leaves out the time
+            # spent by the consumer between two records.
+            execute_started = time.perf_counter()
+            execute_seconds = 0.0
+            with RenameBatch(series_id, [(op["old"], op["new"]) for op in operations]) as batch:
+                for directory in rename_plan["directories"]:
+                    prepare_directory(directory, UID, GID)
+
+                for seq, op in enumerate(operations):
+                    try:
+                        rename_result = rename_file(op["old"], op["new"], UID, GID, prepare_dir=False)
+                    except OSError:
+                        metrics.inc("renamerr_files_total", "failed")
+                        raise
+                    batch.mark_done(seq)
+                    if op["item"] is None:
+                        # First leg of a cycle, the file is not at its target yet
+                        continue
+                    metrics.inc("renamerr_files_total", "renamed")
+
+                    item = to_rename[op["item"]]
+                    current_path = item["current"]
+                    new_path = item["new"]
+                    if rename_preview:
+                        logs.append(rename_result["message"])
+                    elif item.get("file_id") in episode_files:
+                        file_stamps[str(item["file_id"])] = episode_file_stamp(episode_files[item["file_id"]], new_path)
+                    num_renamed += 1
+                    execute_seconds += time.perf_counter() - execute_started
+                    yield "file", {
+                        "message": f"Episode {item['episode']} file renamed successfully.",
+                        "new": new_path,
+                        "old": current_path,
+                        "status": "renamed"
+                    }
+                    execute_started = time.perf_counter()
+            execute_seconds += time.perf_counter() - execute_started
+            observe_timing(RENAME_PHASE_METRIC, execute_seconds, "execute")
+
+        if not rename_preview:
+            store_series_watermark(
+                series_id, settings_hash, hash_file_stamps(settings_hash, file_stamps), file_stamps
+            )
 
         # Construct a summary message
-        num_renamed = len([f for f in renamed_files if f["status"] == "renamed"])
-        num_skipped = len([f for f in renamed_files if f["status"] == "already_renamed"])
         popup_message = f"Renamed {num_renamed} files, skipped {num_skipped} files (already renamed)."
+        if skipped_unchanged:
+            popup_message += f" {skipped_unchanged} files unchanged since the last run."
+        if num_unverified:
+            popup_message += f" {num_unverified} of the skipped files could not be renamed safely, see the logs."
+        if num_failed:
+            popup_message += f" {num_failed} files were not renamed by Sonarr."
 
-            # Trigger Sonarr rescan only if at least one file was renamed
+        # Trigger Sonarr rescan only if at least one file was renamed
         rescan_status = "not_triggered"
-        if num_renamed > 0:
-            rescan_response = requests.post(
-                f"{SONARR_API_URL}/command",
-                headers=headers,
-                json={
-                    "name": "RescanSeries",
-                    "seriesId": series_id
-                }
-            )
-            rescan_status = "success" if rescan_response.status_code == 201 else "failed"
+        if num_renamed > 0 and backend == "sonarr":
+            # Sonarr already knows the new paths
+            rescan_status = "not_needed"
+        elif num_renamed > 0:
+            # The cached episode files still point at the old paths
+            if series_id:
+                invalidate_series_cache(series_id)
+            with timed(RENAME_PHASE_METRIC, "rescan"):
+                rescan_status = trigger_rescan(series_id)
 
-        return {
+        yield "summary", {
             "id": series_id,
             "title": chosen_title,
-            "renamed_files": renamed_files,
             "rescan_status": rescan_status,
             "success": True,
             "logs": logs,
+            "skipped_unchanged": skipped_unchanged,
+            "unverified": num_unverified,
+            "batch_id": batch.id if batch else None,
+            "syscalls": dict(rename_plan["syscalls"], planned=0) if backend == "sonarr" else rename_plan["syscalls"],
             "message": popup_message
         }
 
+    except RenameConflictError as e:
+        logger.error(f"Rename of series {series_id} aborted: {str(e)}")
+        metrics.inc("renamerr_files_total", "failed", value=len(to_rename))
+        yield "summary", {"error": str(e), "conflicts": e.conflicts}
+
     except Exception as e:
         logger.error(f"Error during rename operation: {str(e)}")
-        return {"error": str(e)}
+        summary = {"error": str(e)}
+        if batch and batch.id:
+            summary["batch_id"] = batch.id
+            summary.update(roll_back_failed_batch(batch.id, series_id))
+        yield "summary", summary
 
 if __name__ == "__main__":
     initialize_database()
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    load_sonarr_instances()
+    recover_rename_journal()
+    recover_jobs()
+    # The debug reloader runs this module in a watcher process too, only the serving process runs jobs
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_job_workers()
+    try:
+        app.run(host="0.0.0.0", port=5000, debug=True)
+    finally:
+        # Send the rescans still waiting for their debounce window
+        rescan_scheduler.flush()
\ No newline at end of file
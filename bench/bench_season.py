@@ -0,0 +1,82 @@
+"""
+Per-file cost of the season folder check in determine_new_path: the precompiled matcher
+memoized per directory against the former 100 substring scans of the full path.
+
+Usage: python bench/bench_season.py [--files 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+
+
+def legacy_in_season(current_path):
+    """The season folder check of determine_new_path as it was before is_season_folder."""
+    return any(f"Season {i:02d}" for i in range(100) if f"Season {i:02d}" in current_path)
+
+
+def synthetic_library(count, seed=0):
+    """Episode paths spread over series, half of them in season folders, 24 episodes per folder."""
+    rng = random.Random(seed)
+    paths = []
+    series = 0
+    while len(paths) < count:
+        series += 1
+        root = f"/tv/Series {series} ({rng.randint(1990, 2025)})"
+        seasons = rng.randint(1, 12)
+        layout = rng.choice(["season", "single", "specials"])
+        for season in range(1, seasons + 1):
+            if layout == "single":
+                directory = root
+            elif layout == "specials" and season == 1:
+                directory = f"{root}/Specials"
+            else:
+                directory = f"{root}/Season {season:02d}"
+            for episode in range(1, 25):
+                paths.append(f"{directory}/Series {series} - S{season:02d}E{episode:02d} [WEBDL-1080p].mkv")
+    return paths[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100000, help="number of synthetic episode paths")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions, the best one is reported")
+    args = parser.parse_args()
+
+    paths = synthetic_library(args.files)
+    directories = len({os.path.dirname(path) for path in paths})
+
+    # Specials folders are the intended difference, everything else must agree
+    mismatches = sum(
+        legacy_in_season(path) != app.is_season_folder(os.path.dirname(path))
+        for path in paths if not os.path.dirname(path).endswith("/Specials")
+    )
+
+    def run_memoized():
+        app.is_season_folder.cache_clear()
+        return [app.is_season_folder(os.path.dirname(path)) for path in paths]
+
+    candidates = {
+        "legacy substring scans": lambda: [legacy_in_season(path) for path in paths],
+        "precompiled, unmemoized": lambda: [
+            app.SEASON_FOLDER_RE.match(os.path.basename(os.path.dirname(path))) is not None for path in paths
+        ],
+        "precompiled, memoized": run_memoized,
+    }
+
+    print(f"{args.files} paths in {directories} directories, best of {args.repeat} runs, mismatches: {mismatches}")
+    baseline = None
+    for name, run in candidates.items():
+        seconds = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        per_file = seconds / args.files * 1e9
+        baseline = baseline or per_file
+        print(f"{name:28s} {per_file:8.0f} ns/file  {per_file / baseline:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Per-file cost of generate_new_filename: the compiled rename templates against the
+former str.format implementation.
+
+Usage: python bench/bench_template.py [--files 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+
+LEGACY_FORMAT_TEMPLATE = (
+    "{Series_Title} - {episode:02d} [{Quality_Full} {MediaInfo_VideoCodec} {Mediainfo_AudioCodec}]{Release_Group}"
+)
+
+
+def legacy_generate_new_filename(episode_file, chosen_title, episode_label, file_extension):
+    """generate_new_filename as it was before rename templates."""
+    quality = episode_file["quality"]["quality"]["name"]
+    media_info = episode_file.get("mediaInfo", {})
+    video_codec = media_info.get("videoCodec", "")
+    audio_codec = media_info.get("audioCodec", "")
+    audio_channels = str(media_info.get("audioChannels", ""))
+    if audio_channels == "2":
+        audio_channels = "2.0"
+    release_group = episode_file.get("releaseGroup", "")
+    release_group_part = f"-{release_group}" if release_group else ""
+
+    return LEGACY_FORMAT_TEMPLATE.format(
+        Series_Title=chosen_title,
+        episode=episode_label,
+        Quality_Full=quality,
+        MediaInfo_VideoCodec=video_codec,
+        Mediainfo_AudioCodec=audio_codec,
+        Mediainfo_AudioChannels=audio_channels,
+        Release_Group=release_group_part,
+    ) + file_extension
+
+
+def synthetic_episode_files(count, seed=0):
+    rng = random.Random(seed)
+    files = []
+    for _ in range(count):
+        files.append({
+            "quality": {"quality": {"name": rng.choice(["Bluray-1080p", "WEBDL-1080p", "HDTV-720p"])}},
+            "mediaInfo": {
+                "videoCodec": rng.choice(["x265", "x264", "AV1", ""]),
+                "audioCodec": rng.choice(["FLAC", "AAC", "Opus"]),
+                "audioChannels": rng.choice([2, 5.1]),
+            },
+            "releaseGroup": rng.choice(["SubsPlease", "Erai-raws", ""]),
+        })
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100000, help="number of synthetic episode files")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions, the best one is reported")
+    args = parser.parse_args()
+
+    files = synthetic_episode_files(args.files)
+    labels = [index % 1500 + 1 for index in range(args.files)]
+    pairs = list(zip(files, labels))
+
+    # The default template must keep producing the legacy names
+    mismatches = sum(
+        legacy_generate_new_filename(file, "Series Title", label, ".mkv")
+        != app.generate_new_filename(file, "Series Title", label, ".mkv")
+        for file, label in pairs
+    )
+
+    custom_template = "{Series Title|upper} - S{season:00}E{episode:00} <[{Quality Full}{ MediaInfo VideoCodec}]>{-Release Group}"
+    candidates = {
+        "legacy str.format": lambda: [
+            legacy_generate_new_filename(file, "Series Title", label, ".mkv") for file, label in pairs
+        ],
+        "compiled default template": lambda: [
+            app.generate_new_filename(file, "Series Title", label, ".mkv") for file, label in pairs
+        ],
+        "compiled custom template": lambda: [
+            app.generate_new_filename(file, "Series Title", label, ".mkv", custom_template, 1) for file, label in pairs
+        ],
+    }
+
+    compile_seconds = min(timeit.repeat(
+        lambda: app.compile_template.__wrapped__(custom_template), number=1000, repeat=args.repeat
+    )) / 1000
+
+    print(f"{args.files} files, best of {args.repeat} runs, default template mismatches: {mismatches}")
+    print(f"template compilation (once per template): {compile_seconds * 1e6:.1f} us")
+    baseline = None
+    for name, run in candidates.items():
+        seconds = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        per_file = seconds / args.files * 1e9
+        baseline = baseline or per_file
+        print(f"{name:28s} {per_file:8.0f} ns/file  {per_file / baseline:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
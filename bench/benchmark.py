@@ -0,0 +1,197 @@
+"""
+End-to-end benchmark of the rename paths against the mock Sonarr, on a temporary directory
+of empty episode files.
+
+Times, in order:
+ - preview-rename: POST /preview-rename, once per series
+ - confirm-rename: POST /confirm-rename with that preview, once per series (process_rename)
+ - autorename:     POST /api/autorename over every series with a new title, then again
+                   without changes (incremental run), then with another title through the
+                   "sonarr" rename backend (RenameFiles instead of moving the files and rescanning)
+ - rename-plan:    GET /api/rename-plan for the whole library, then POST /api/rename-plan/apply
+                   with the exported rows
+
+and reports throughput (files/s), p50/p99 latency per call and peak traced memory per phase.
+
+Usage: python bench/benchmark.py [--series 50] [--episodes 24] [--seasons 2] [--layout mixed]
+                                 [--latency 0.005] [--workers 4] [--no-tracemalloc] [--json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from mock_sonarr import LAYOUTS, MockLibrary, start_server  # noqa: E402
+
+# Sonarr only accepts naming formats of standard series with the season and the episode in them
+SONARR_TEMPLATE = "{Series Title} - S{season:00}E{episode:00} [{Quality Full} {MediaInfo VideoCodec}]{-Release Group}"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, int(round(len(ordered) * fraction)) - 1)] if ordered else 0.0
+
+
+class Phase:
+    """Times the calls of one benchmark phase and the peak memory traced while it runs."""
+
+    def __init__(self, name, files, trace_memory):
+        self.name = name
+        self.files = files
+        self.trace_memory = trace_memory
+        self.latencies = []
+        self.errors = 0
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        return self
+
+    def call(self, function, *args, **kwargs):
+        started = time.perf_counter()
+        response = function(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors += 1
+        return response
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.peak_bytes = 0
+        if self.trace_memory:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return False
+
+    def report(self):
+        return {
+            "phase": self.name,
+            "calls": len(self.latencies),
+            "errors": self.errors,
+            "files": self.files,
+            "seconds": round(self.seconds, 3),
+            "files_per_second": round(self.files / self.seconds, 1) if self.seconds else None,
+            "p50_ms": round(statistics.median(self.latencies) * 1000, 2) if self.latencies else None,
+            "p99_ms": round(percentile(self.latencies, 0.99) * 1000, 2),
+            "peak_memory_kib": round(self.peak_bytes / 1024, 1) if self.trace_memory else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=50)
+    parser.add_argument("--episodes", type=int, default=24, help="episodes per series")
+    parser.add_argument("--seasons", type=int, default=2, help="seasons the episodes are spread over")
+    parser.add_argument("--layout", choices=LAYOUTS, default="mixed")
+    parser.add_argument("--latency", type=float, default=0.005, help="mock Sonarr latency per request, in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="series renamed in parallel by autorename")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip memory tracing, it slows the timed code")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="renamerr-bench-")
+    try:
+        library = MockLibrary(args.series, args.episodes, args.seasons, args.layout, os.path.join(workdir, "tv"))
+        server = start_server(library, latency=args.latency)
+
+        # app reads its settings at import time
+        os.environ.update(
+            SONARR_API_URL=f"http://127.0.0.1:{server.server_port}/api/v3",
+            SONARR_API_KEY="benchmark",
+            DB_PATH=os.path.join(workdir, "config", "renamerr.db"),
+            PUID=str(os.getuid()),
+            PGID=str(os.getgid()),
+        )
+        import app
+        app.logger.setLevel("WARNING")
+        app.initialize_database()
+        client = app.app.test_client()
+        trace_memory = not args.no_tracemalloc
+        series_ids = [series["id"] for series in library.series]
+        phases = []
+
+        previews = {}
+        with Phase("preview-rename", library.file_count, trace_memory) as phase:
+            for series_id in series_ids:
+                response = phase.call(client.post, "/preview-rename", json={
+                    "series_id": series_id,
+                    "chosen_title": f"Alt Show {series_id}",
+                    "use_season_folders": True,
+                })
+                previews[series_id] = response.get_json().get("rename_preview", {})
+        phases.append(phase)
+
+        with Phase("confirm-rename", library.file_count, trace_memory) as phase:
+            for series_id in series_ids:
+                phase.call(client.post, "/confirm-rename", json={
+                    "series_id": series_id,
+                    "chosen_title": f"Alt Show {series_id}",
+                    "rename_preview": previews[series_id],
+                })
+        phases.append(phase)
+
+        # Have the mock Sonarr pick up the renamed files now rather than after the debounce window
+        app.rescan_scheduler.flush()
+        for series_id in series_ids:
+            app.store_series_info(series_id, f"Other Show {series_id}", series_id % 2 == 0, False)
+        app.current_instance().cache.clear()
+        with Phase("autorename", library.file_count, trace_memory) as phase:
+            phase.call(client.post, "/api/autorename", json={"workers": args.workers})
+        phases.append(phase)
+
+        with Phase("autorename (unchanged)", library.file_count, trace_memory) as phase:
+            phase.call(client.post, "/api/autorename", json={"workers": args.workers})
+        phases.append(phase)
+
+        # Same sweep with Sonarr renaming the files through RenameFiles instead of a rescan
+        app.rescan_scheduler.flush()
+        for series_id in series_ids:
+            app.store_series_info(series_id, f"Show {series_id}", series_id % 2 == 0, False, SONARR_TEMPLATE, "sonarr")
+        with Phase("autorename (sonarr)", library.file_count, trace_memory) as phase:
+            phase.call(client.post, "/api/autorename", json={"workers": args.workers})
+        phases.append(phase)
+
+        # Plan the whole library from the cached data, then apply the exported rows
+        app.rescan_scheduler.flush()
+        for series_id in series_ids:
+            app.store_series_info(series_id, f"Alt Show {series_id}", True, False)
+        with Phase("rename-plan export", library.file_count, trace_memory) as phase:
+            response = phase.call(client.get, "/api/rename-plan", query_string={"status": "needs_rename"})
+            plan = response.get_data()
+        phases.append(phase)
+
+        with Phase("rename-plan apply", library.file_count, trace_memory) as phase:
+            phase.call(client.post, "/api/rename-plan/apply", data=plan, content_type="application/x-ndjson",
+                       query_string={"workers": args.workers})
+        phases.append(phase)
+
+        server.shutdown()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = [phase.report() for phase in phases]
+    if args.json:
+        print(json.dumps({"parameters": vars(args), "results": results}, indent=2))
+        return
+
+    print(f"{args.series} series x {args.episodes} episodes ({args.layout} layout), "
+          f"mock latency {args.latency * 1000:g} ms, {args.workers} autorename workers")
+    print(f"{'phase':24s} {'files/s':>9s} {'p50 ms':>9s} {'p99 ms':>9s} {'peak KiB':>10s} {'errors':>7s}")
+    for result in results:
+        peak = f"{result['peak_memory_kib']:10.1f}" if result["peak_memory_kib"] is not None else f"{'-':>10s}"
+        print(f"{result['phase']:24s} {result['files_per_second']:9.1f} {result['p50_ms']:9.2f} "
+              f"{result['p99_ms']:9.2f} {peak} {result['errors']:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Requests/sec and latency of /series and /preview-rename under concurrent load, served by the
+Flask debug server (python app.py) and by gunicorn (gunicorn.conf.py), against the mock Sonarr.
+
+Usage: python bench/loadtest.py [--server both] [--concurrency 16] [--duration 10]
+                                [--series 50] [--episodes 24] [--latency 0.02]
+                                [--workers 1] [--threads 16]
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+
+from mock_sonarr import MockLibrary, start_server
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_URL = "http://127.0.0.1:5000"
+
+
+def start_app(mode, env, workers, threads):
+    """Start renamerr in a new process group and wait until it answers."""
+    if mode == "dev":
+        command = [sys.executable, "app.py"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "app:app"]
+        env = dict(env, WEB_WORKERS=str(workers), WEB_THREADS=str(threads))
+    process = subprocess.Popen(
+        command, cwd=REPO_ROOT, env=env, start_new_session=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{APP_URL}/api/stats", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_app(process)
+    raise RuntimeError(f"renamerr ({mode}) did not start")
+
+
+def stop_app(process):
+    # The debug server runs the app in a reloader child, stop the whole group
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait()
+
+
+def run_load(name, make_request, concurrency, duration):
+    """Send requests from `concurrency` threads for `duration` seconds and report throughput and latency."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        session = requests.Session()
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = make_request(session, index).ok
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - started)
+            failed += not ok
+            index += concurrency
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    clients = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    print(f"  {name:22s} {len(latencies) / duration:8.1f} req/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  errors {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["dev", "gunicorn", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint")
+    parser.add_argument("--series", type=int, default=50, help="series in the mock library")
+    parser.add_argument("--episodes", type=int, default=24, help="episodes per series")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock Sonarr latency per request, in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="WEB_WORKERS for gunicorn")
+    parser.add_argument("--threads", type=int, default=16, help="WEB_THREADS for gunicorn")
+    parser.add_argument("--sonarr-port", type=int, default=8998)
+    args = parser.parse_args()
+
+    mock = start_server(MockLibrary(args.series, args.episodes), args.sonarr_port, args.latency)
+    config_dir = tempfile.mkdtemp(prefix="renamerr-loadtest-")
+    env = dict(
+        os.environ,
+        SONARR_API_URL=f"http://127.0.0.1:{args.sonarr_port}/api/v3",
+        SONARR_API_KEY="loadtest",
+        DB_PATH=os.path.join(config_dir, "renamerr.db"),
+    )
+
+    def get_series(session, index):
+        return session.get(f"{APP_URL}/series")
+
+    def preview_rename(session, index):
+        series_id = index % args.series + 1
+        return session.post(f"{APP_URL}/preview-rename", json={
+            "series_id": series_id,
+            "chosen_title": f"Alt Show {series_id}",
+            "use_season_folders": True,
+        })
+
+    modes = ["dev", "gunicorn"] if args.server == "both" else [args.server]
+    print(f"{args.series} series x {args.episodes} episodes, {args.concurrency} clients, "
+          f"{args.duration:g}s per endpoint, mock latency {args.latency * 1000:g} ms")
+    try:
+        for mode in modes:
+            label = mode if mode == "dev" else f"gunicorn ({args.workers} workers x {args.threads} threads)"
+            print(label)
+            process = start_app(mode, env, args.workers, args.threads)
+            try:
+                run_load("GET /series", get_series, args.concurrency, args.duration)
+                run_load("POST /preview-rename", preview_rename, args.concurrency, args.duration)
+            finally:
+                stop_app(process)
+    finally:
+        mock.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Self-contained fake Sonarr serving a synthetic library, for benchmarks and load tests.
+
+Implements the parts of the v3 API renamerr uses: /series, /series/{id} (GET and PUT), /episode,
+/episodefile, /config/naming (GET, and PUT refusing formats without the episode numbering Sonarr
+requires) and /command (POST, plus GET of the queued commands).
+With --root, empty episode files are created on disk, RescanSeries picks up renamed files again
+and RenameFiles renames them after the naming settings, for the tokens renamerr's Sonarr backend
+produces.
+
+Usage: python bench/mock_sonarr.py [--series 50] [--episodes 24] [--seasons 1]
+                                   [--layout season|single|mixed] [--root DIR]
+                                   [--latency 0.02] [--jitter 0] [--port 8998]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LAYOUTS = ("season", "single", "mixed")
+
+# {<prefix><Token Name>[:<padding>]<suffix>} in a naming format
+NAMING_TOKEN_RE = re.compile(r"\{([^A-Za-z0-9{}]*)([A-Za-z][A-Za-z ]*?)(?::(0+))?([^A-Za-z0-9{}]*)\}")
+
+# Naming setting of each series type, and the episode numbering Sonarr requires in it
+NAMING_FIELDS = {"standard": "standardEpisodeFormat", "daily": "dailyEpisodeFormat", "anime": "animeEpisodeFormat"}
+SEASON_EPISODE_RE = re.compile(r"s?\{season(?::0+)?\}[- ._]?[ex]\{episode(?::0+)?\}", re.IGNORECASE)
+ABSOLUTE_RE = re.compile(r"\{absolute(?::0+)?\}", re.IGNORECASE)
+AIR_DATE_RE = re.compile(r"\{Air(?:\s|\W|_)Date\}", re.IGNORECASE)
+
+
+def naming_errors(naming):
+    """Validation errors Sonarr answers a PUT of /config/naming with, empty when it accepts it."""
+    rules = {
+        "standardEpisodeFormat": (SEASON_EPISODE_RE,),
+        "dailyEpisodeFormat": (AIR_DATE_RE,),
+        "animeEpisodeFormat": (SEASON_EPISODE_RE, ABSOLUTE_RE),
+    }
+    return [
+        {"propertyName": field[0].upper() + field[1:], "errorMessage": "Must contain the episode numbering of its series type"}
+        for field, patterns in rules.items()
+        if not any(pattern.search(naming.get(field) or "") for pattern in patterns)
+    ]
+
+
+class MockLibrary:
+    """
+    Synthetic series, episodes and episode files.
+
+    Args:
+        series_count (int): Number of series.
+        episodes_per_series (int): Number of episodes, each with a file, per series.
+        seasons (int): Number of seasons the episodes are spread over.
+        layout (str): "season" puts files in Season NN folders, "single" directly in the series
+            folder, "mixed" alternates between the two per series.
+        root (str, optional): Directory under which empty episode files are created. Without it
+            the paths are only reported, nothing is written.
+    """
+
+    def __init__(self, series_count=50, episodes_per_series=24, seasons=1, layout="season", root=None, seed=0):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout {layout}, expected one of {', '.join(LAYOUTS)}")
+        rng = random.Random(seed)
+        self.root = root
+        self.series = []
+        self.episodes = {}
+        self.files = {}
+        self.commands = []
+        self.naming = {
+            "id": 1,
+            "renameEpisodes": False,
+            "standardEpisodeFormat": "{Series Title} - S{season:00}E{episode:00} - {Episode Title} {Quality Full}",
+            "dailyEpisodeFormat": "{Series Title} - {Air-Date} - {Episode Title} {Quality Full}",
+            "animeEpisodeFormat": "{Series Title} - S{season:00}E{episode:00} - {Episode Title} {Quality Full}",
+            "seasonFolderFormat": "Season {season}",
+        }
+        self.lock = threading.Lock()
+        # Renamed files are found again by inode, as Sonarr would by parsing their names
+        self._inodes = {}
+
+        file_id = 1
+        base = root or "/tv"
+        per_season = max(1, -(-episodes_per_series // max(1, seasons)))
+        for series_id in range(1, series_count + 1):
+            title = f"Show {series_id}"
+            in_seasons = layout == "season" or (layout == "mixed" and series_id % 2)
+            self.series.append({
+                "id": series_id,
+                "title": title,
+                "path": os.path.join(base, title),
+                "seasonFolder": bool(in_seasons),
+                "seriesType": "standard",
+                "alternateTitles": [{"title": f"Alt Show {series_id}"}, {"title": f"Other Show {series_id}"}],
+            })
+            self.episodes[series_id], self.files[series_id] = [], []
+            for number in range(1, episodes_per_series + 1):
+                season = (number - 1) // per_season + 1
+                directory = os.path.join(base, title, f"Season {season:02d}") if in_seasons else os.path.join(base, title)
+                path = os.path.join(directory, f"show.{series_id}.s{season:02d}e{number:02d}.mkv")
+                self.files[series_id].append({
+                    "id": file_id,
+                    "seriesId": series_id,
+                    "path": path,
+                    "dateAdded": "2024-01-01T00:00:00Z",
+                    "quality": {"quality": {"name": rng.choice(["Bluray-1080p", "WEBDL-1080p", "HDTV-720p"])}},
+                    "mediaInfo": {
+                        "videoCodec": rng.choice(["x265", "x264"]),
+                        "audioCodec": rng.choice(["FLAC", "AAC"]),
+                        "audioChannels": rng.choice([2, 5.1]),
+                    },
+                    "releaseGroup": rng.choice(["GRP", "SubsPlease", ""]),
+                })
+                self.episodes[series_id].append({
+                    "id": file_id,
+                    "seriesId": series_id,
+                    "seasonNumber": season,
+                    "episodeNumber": number,
+                    "absoluteEpisodeNumber": number,
+                    "hasFile": True,
+                    "episodeFileId": file_id,
+                    "title": f"Episode {number}",
+                })
+                if root:
+                    os.makedirs(directory, exist_ok=True)
+                    open(path, "w").close()
+                    self._inodes[os.stat(path).st_ino] = self.files[series_id][-1]
+                file_id += 1
+
+    @property
+    def file_count(self):
+        return sum(len(files) for files in self.files.values())
+
+    def rescan(self, series_id):
+        """Update the paths of the series' episode files to where they are on disk now."""
+        if not self.root:
+            return
+        series = self.series[series_id - 1]
+        for directory, _, names in os.walk(series["path"]):
+            for name in names:
+                path = os.path.join(directory, name)
+                episode_file = self._inodes.get(os.stat(path).st_ino)
+                if episode_file:
+                    episode_file["path"] = path
+
+    def token_value(self, name, episode, episode_file):
+        """Value of a naming token for an episode file, cased like the token name as Sonarr does."""
+        media_info = episode_file.get("mediaInfo") or {}
+        values = {
+            "season": episode["seasonNumber"],
+            "episode": episode["episodeNumber"],
+            "absolute": episode["absoluteEpisodeNumber"],
+            "episode title": episode["title"],
+            "quality full": episode_file["quality"]["quality"]["name"],
+            "quality title": episode_file["quality"]["quality"]["name"],
+            "mediainfo videocodec": media_info.get("videoCodec"),
+            "mediainfo audiocodec": media_info.get("audioCodec"),
+            "mediainfo audiochannels": media_info.get("audioChannels"),
+            "release group": episode_file.get("releaseGroup"),
+        }
+        value = values.get(name.lower())
+        value = "" if value is None else str(value)
+        if name.isupper():
+            return value.upper()
+        if name.islower() and name.lower() not in ("season", "episode", "absolute"):
+            return value.lower()
+        return value
+
+    def format_name(self, naming_format, episode, episode_file):
+        def replace(match):
+            prefix, name, padding, suffix = match.groups()
+            value = self.token_value(name, episode, episode_file)
+            if not value:
+                return ""
+            return f"{prefix}{value.zfill(len(padding or ''))}{suffix}"
+        return NAMING_TOKEN_RE.sub(replace, naming_format)
+
+    def rename_files(self, series_id, file_ids):
+        """RenameFiles: move the episode files to the path the naming settings give them."""
+        series = self.series[series_id - 1]
+        episodes = {episode["episodeFileId"]: episode for episode in self.episodes[series_id]}
+        for episode_file in self.files[series_id]:
+            if file_ids and episode_file["id"] not in file_ids:
+                continue
+            episode = episodes[episode_file["id"]]
+            directory = series["path"]
+            if series["seasonFolder"]:
+                directory = os.path.join(directory, self.format_name(self.naming["seasonFolderFormat"], episode, episode_file))
+            name = self.format_name(self.naming[NAMING_FIELDS[series["seriesType"]]], episode, episode_file)
+            path = os.path.join(directory, name + os.path.splitext(episode_file["path"])[1])
+            if self.root and path != episode_file["path"]:
+                os.makedirs(directory, exist_ok=True)
+                os.rename(episode_file["path"], path)
+            episode_file["path"] = path
+
+    def command(self, body):
+        """Record a command; RescanSeries and RenameFiles run right away and every command completes immediately."""
+        with self.lock:
+            command = dict(body, id=len(self.commands) + 1, status="completed")
+            self.commands.append(command)
+            if body.get("name") == "RescanSeries" and body.get("seriesId"):
+                self.rescan(int(body["seriesId"]))
+            if body.get("name") == "RenameFiles" and body.get("seriesId"):
+                self.rename_files(int(body["seriesId"]), set(body.get("files") or []))
+        return command
+
+
+def make_handler(library, latency=0.0, jitter=0.0):
+    """Request handler class serving `library`, sleeping latency (+ up to jitter) seconds per request."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def delay(self):
+            if latency or jitter:
+                time.sleep(latency + random.random() * jitter)
+
+        def do_GET(self):
+            self.delay()
+            url = urlparse(self.path)
+            path = url.path.replace("/api/v3", "").rstrip("/")
+            query = parse_qs(url.query)
+            try:
+                if path == "/series":
+                    return self.send(library.series)
+                if path.startswith("/series/"):
+                    return self.send(library.series[int(path.split("/")[2]) - 1])
+                if path == "/episode":
+                    return self.send(library.episodes[int(query["seriesId"][0])])
+                if path == "/episodefile":
+                    return self.send(library.files[int(query["seriesId"][0])])
+                if path == "/config/naming":
+                    return self.send(library.naming)
+                if path == "/command":
+                    return self.send(library.commands)
+                if path.startswith("/command/"):
+                    return self.send(library.commands[int(path.split("/")[2]) - 1])
+            except (IndexError, KeyError, ValueError):
+                pass
+            self.send({"message": "NotFound"}, 404)
+
+        def do_POST(self):
+            self.delay()
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if urlparse(self.path).path.replace("/api/v3", "").rstrip("/") != "/command":
+                return self.send({"message": "NotFound"}, 404)
+            self.send(library.command(body), 201)
+
+        def do_PUT(self):
+            self.delay()
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = urlparse(self.path).path.replace("/api/v3", "").rstrip("/")
+            with library.lock:
+                if path.startswith("/config/naming"):
+                    errors = naming_errors(body)
+                    if errors:
+                        return self.send(errors, 400)
+                    library.naming = dict(body, id=library.naming["id"])
+                    return self.send(library.naming, 202)
+                if path.startswith("/series/"):
+                    series = library.series[int(path.split("/")[2]) - 1]
+                    series["seasonFolder"] = bool(body.get("seasonFolder", series["seasonFolder"]))
+                    return self.send(series, 202)
+            self.send({"message": "NotFound"}, 404)
+
+    return Handler
+
+
+def start_server(library, port=0, latency=0.0, jitter=0.0):
+    """Serve `library` on a background thread. Port 0 picks a free one, see server.server_port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(library, latency, jitter))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=50)
+    parser.add_argument("--episodes", type=int, default=24, help="episodes per series")
+    parser.add_argument("--seasons", type=int, default=1, help="seasons the episodes are spread over")
+    parser.add_argument("--layout", choices=LAYOUTS, default="season")
+    parser.add_argument("--root", help="create empty episode files under this directory")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+    parser.add_argument("--port", type=int, default=8998)
+    args = parser.parse_args()
+
+    library = MockLibrary(args.series, args.episodes, args.seasons, args.layout, args.root)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(library, args.latency, args.jitter))
+    print(f"Mock Sonarr with {len(library.series)} series and {library.file_count} files "
+          f"on http://127.0.0.1:{args.port}/api/v3")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Gunicorn settings for production serving: gunicorn --config gunicorn.conf.py app:app
+
+Threaded workers suit renamerr, requests mostly wait on Sonarr and the disk. Each worker
+process has its own Sonarr cache, and a Sonarr webhook only reaches one of them, so scale
+with WEB_THREADS first and keep WEB_WORKERS low.
+"""
+import os
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_WORKERS", 1))
+threads = int(os.getenv("WEB_THREADS", 16))
+# Streaming responses and synchronous sweeps can take a while, prefer "async": true for large ones
+timeout = int(os.getenv("WEB_TIMEOUT", 300))
+accesslog = "-" if os.getenv("WEB_ACCESS_LOG", "false").lower() == "true" else None
+
+
+def on_starting(server):
+    """
+    Migrate the database, load SONARR_INSTANCES_FILE and recover interrupted renames and jobs
+    once, in the master process.
+    """
+    import app
+
+    app.initialize_database()
+    app.load_sonarr_instances()
+    app.recover_rename_journal()
+    app.recover_jobs()
+    # Workers open their own connections, never share one across a fork: recovery may have
+    # left keep-alive sockets to Sonarr in the session pools as well
+    app.sonarr_instances.close()
+    app.close_db()
+
+
+def post_worker_init(worker):
+    """Start the background job workers of each worker process."""
+    import app
+
+    app.start_job_workers()
+
+
+def worker_exit(server, worker):
+    """Send the rescans still waiting for their debounce window before the worker stops."""
+    import app
+
+    app.rescan_scheduler.flush()
@@ -0,0 +1,136 @@
+"""
+Recovery of rename batches: a batch is rolled back or resumed from the journal and the disk,
+and never moves a file onto one that exists.
+
+Run from the repository root with python -m pytest.
+"""
+import os
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "DB_PATH", str(tmp_path / "config" / "renamerr.db"))
+    monkeypatch.setenv("PUID", str(os.getuid()))
+    monkeypatch.setenv("PGID", str(os.getgid()))
+    app.initialize_database()
+    season = tmp_path / "tv" / "Show" / "Season 01"
+    season.mkdir(parents=True)
+    yield season
+    app.close_db()
+
+
+def write_files(directory, contents):
+    for name, content in contents.items():
+        (directory / name).write_text(content)
+
+
+def read_files(directory):
+    return {path.name: path.read_text() for path in directory.iterdir()}
+
+
+def swap_preview(directory):
+    a, b = str(directory / "A.mkv"), str(directory / "B.mkv")
+    return {"1": [
+        {"episode": 1, "file_id": 1, "current": a, "new": b, "status": "needs_rename"},
+        {"episode": 2, "file_id": 2, "current": b, "new": a, "status": "needs_rename"},
+    ]}
+
+
+def start_batch(moves, moves_done, mark_done=True):
+    """Journal a batch of moves and carry out the first moves_done of them, as a process that then died."""
+    operations = app.plan_rename_batch(moves)["operations"]
+    batch = app.RenameBatch(None, [(op["old"], op["new"]) for op in operations]).__enter__()
+    for seq, op in enumerate(operations[:moves_done]):
+        os.rename(op["old"], op["new"])
+        if mark_done:
+            batch.mark_done(seq)
+    return batch.id
+
+
+def test_swap_untouched_when_failing_before_the_first_move(library, monkeypatch):
+    write_files(library, {"A.mkv": "a", "B.mkv": "b"})
+
+    def prepare_directory(directory, UID, GID):
+        raise PermissionError(f"Operation not permitted: {directory}")
+
+    monkeypatch.setattr(app, "prepare_directory", prepare_directory)
+    result = app.process_rename(rename_preview=swap_preview(library))
+
+    assert result["rolled_back"] == 0
+    assert read_files(library) == {"A.mkv": "a", "B.mkv": "b"}
+    assert app.get_rename_batch(result["batch_id"])["status"] == "rolled_back"
+
+
+@pytest.mark.parametrize("moves_done", [0, 1, 2])
+def test_swap_rolled_back_after_each_move(library, monkeypatch, moves_done):
+    write_files(library, {"A.mkv": "a", "B.mkv": "b"})
+    rename_file = app.rename_file
+    calls = []
+
+    def failing_rename_file(*args, **kwargs):
+        if len(calls) == moves_done:
+            raise PermissionError("Operation not permitted")
+        calls.append(args)
+        return rename_file(*args, **kwargs)
+
+    monkeypatch.setattr(app, "rename_file", failing_rename_file)
+    result = app.process_rename(rename_preview=swap_preview(library))
+
+    assert result["rolled_back"] == moves_done
+    assert read_files(library) == {"A.mkv": "a", "B.mkv": "b"}
+
+
+@pytest.mark.parametrize("moves_done", [0, 1, 2, 3])
+@pytest.mark.parametrize("mode, expected", [
+    ("rollback", {"A.mkv": "a", "B.mkv": "b"}),
+    ("resume", {"A.mkv": "b", "B.mkv": "a"}),
+])
+def test_interrupted_swap_recovered_after_each_move(library, moves_done, mode, expected):
+    write_files(library, {"A.mkv": "a", "B.mkv": "b"})
+    a, b = str(library / "A.mkv"), str(library / "B.mkv")
+    batch_id = start_batch([(a, b), (b, a)], moves_done)
+
+    app.recover_rename_journal(mode)
+
+    assert read_files(library) == expected
+    assert app.get_rename_batch(batch_id)["status"] == ("rolled_back" if mode == "rollback" else "completed")
+
+
+def test_resume_does_not_replay_a_finished_chain(library):
+    write_files(library, {"X.mkv": "c-X", "Y.mkv": "c-Y"})
+    x, y, z = (str(library / name) for name in ("X.mkv", "Y.mkv", "Z.mkv"))
+    batch_id = start_batch([(x, y), (y, z)], 2)
+
+    app.recover_rename_journal("resume")
+
+    assert read_files(library) == {"Y.mkv": "c-X", "Z.mkv": "c-Y"}
+    assert app.get_rename_batch(batch_id)["status"] == "completed"
+
+
+def test_resume_never_overwrites_a_target(library):
+    write_files(library, {"X.mkv": "c-X", "Y.mkv": "c-Y"})
+    x, y, z = (str(library / name) for name in ("X.mkv", "Y.mkv", "Z.mkv"))
+    # Both moves happened but the process died before marking them done
+    batch_id = start_batch([(x, y), (y, z)], 2, mark_done=False)
+
+    app.recover_rename_journal("resume")
+
+    assert read_files(library) == {"Y.mkv": "c-X", "Z.mkv": "c-Y"}
+    assert app.get_rename_batch(batch_id)["status"] == "failed"
+
+
+def test_rollback_never_overwrites_an_original_path(library):
+    write_files(library, {"X.mkv": "c-X"})
+    x, y = str(library / "X.mkv"), str(library / "Y.mkv")
+    batch_id = start_batch([(x, y)], 1)
+    # Another file took the original name in the meantime
+    write_files(library, {"X.mkv": "new"})
+
+    app.recover_rename_journal("rollback")
+
+    assert read_files(library) == {"X.mkv": "new", "Y.mkv": "c-X"}
+    assert app.get_rename_batch(batch_id)["status"] == "rolled_back"